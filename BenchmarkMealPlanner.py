@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import WeekMealPlanner
+
+item_names = ['feta', 'pasta', 'rice', 'spinach', 'milk', 'yoghurt', 'cucumber', 'tomatoes', 'red onion', 'olives',
+              'chickpeas', 'lentils', 'quinoa', 'avocado', 'lime', 'lemon', 'walnuts', 'rocket', 'bell pepper', 'carrots',
+              'mozzarella', 'basil', 'parsley', 'couscous', 'beetroot', 'goat cheese', 'sweet potato', 'corn', 'tuna', 'eggs']
+pantry_items = ['olive oil', 'salt', 'pepper', 'honey', 'mustard']
+quantity_formats = ['{n} g {item}', '{k} kg {item}', '{n} gram {item}', '{e} el {item}', '{e} tsp {item}', '{c} ml {item}',
+                    '½ {item}', '1/3 cup {item}', '{e}-{e2} {item}', '1 1/2 {item}', '{e} {item} (chopped), fresh', '{item}']
+filler_words = ['mix', 'the', 'salad', 'with', 'and', 'serve', 'cold', 'bowl', 'dressing', 'toss', 'slice', 'bake']
+
+def ingredient_line(rng):
+    item = rng.choice(item_names + pantry_items)
+    e = rng.randint(1, 4)
+    return rng.choice(quantity_formats).format(
+        n=rng.choice([50, 100, 150, 200, 250]), k=rng.choice(['0.2', '0,5', '1']), e=e, e2=e + rng.randint(1, 2),
+        c=rng.choice([100, 250, 500]), item=item)
+
+def recipe_note(rng, tags, min_ingredients, max_ingredients):
+    lines = []
+    if rng.random() < 0.5:
+        lines += ['---', f"tags: [{', '.join(tags)}]", '---']
+    else:
+        lines.append(' '.join(f"#{tag}" for tag in tags))
+    lines += [f"portions: {rng.choice([1, 2, 4])}", '', '## Ingredients']
+    lines += [f"- {ingredient_line(rng)}" for _ in range(rng.randint(min_ingredients, max_ingredients))]
+    lines += ['', '## Steps']
+    lines += [' '.join(rng.choice(filler_words) for _ in range(15)) for _ in range(rng.randint(2, 10))]
+    return '\n'.join(lines) + '\n'
+
+def generate_vault(folder, num_notes=2000, depth=3, fanout=4, tagged_share=0.3, min_ingredients=4,
+                   max_ingredients=15, seed=42):
+    # Writes num_notes notes spread over a tree of depth levels with fanout
+    # subfolders each. tagged_share of them carry #LunchSalad, the rest other tags.
+    rng = random.Random(seed)
+    folders = [folder]
+    level = [folder]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"folder_{i}") for parent in level for i in range(fanout)]
+        folders += level
+    for path in folders:
+        os.makedirs(path, exist_ok=True)
+
+    for n in range(num_notes):
+        tags = ['LunchSalad'] if rng.random() < tagged_share else [rng.choice(['Dinner', 'Breakfast', 'Soup'])]
+        if rng.random() < 0.3:
+            tags.append('Vegetarian')
+        with open(os.path.join(rng.choice(folders), f"Recipe {n:05d}.md"), 'w', encoding='utf-8') as f:
+            f.write(recipe_note(rng, tags, min_ingredients, max_ingredients))
+    return folders
+
+def touch_notes(folder, share, seed=42):
+    # Changes share of the notes, to time an incremental refresh
+    rng = random.Random(seed)
+    notes = sorted(WeekMealPlanner.scan_markdown_files(folder))
+    for path in rng.sample(notes, int(len(notes) * share)):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\nedited\n')
+    return notes
+
+def run_stage(name, func, profile_dir=None, trace_memory=False):
+    # Times func, optionally with cProfile (dumped to <profile_dir>/<name>.prof)
+    # and tracemalloc (peak of the traced Python allocations)
+    profiler = cProfile.Profile() if profile_dir else None
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    result = func()
+    if profiler:
+        profiler.disable()
+    stats = {'stage': name, 'seconds': time.perf_counter() - start}
+    if trace_memory:
+        stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    if profiler:
+        stats['profile'] = os.path.join(profile_dir, f"{name}.prof")
+        profiler.dump_stats(stats['profile'])
+    return result, stats
+
+def time_repeated(func, repeats):
+    # Median and best of repeats calls, in milliseconds
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings)
+
+def run_benchmark(vault_dir, index_path, args, profile_dir=None):
+    WeekMealPlanner.recipes_folder = vault_dir
+    WeekMealPlanner.index_path = index_path
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    stages = []
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        recipes, stats = run_stage('cold_start', WeekMealPlanner.get_lunch_salad_recipes, profile_dir, args.tracemalloc)
+        stats['recipes'] = len(recipes)
+        stages.append(stats)
+
+        _, stats = run_stage('warm_start', WeekMealPlanner.get_lunch_salad_recipes, profile_dir, args.tracemalloc)
+        stages.append(stats)
+
+        touch_notes(vault_dir, args.touched, args.seed)
+        _, stats = run_stage('incremental_start', WeekMealPlanner.get_lunch_salad_recipes, profile_dir, args.tracemalloc)
+        stages.append(stats)
+
+    # Parsing throughput over every ingredient line in the vault
+    lines = [line for recipe in recipes.values() for line in recipe['ingredients']]
+
+    def parse_all():
+        for line in lines:
+            WeekMealPlanner.parse_ingredient(line)
+    _, stats = run_stage('parse_ingredients', parse_all, profile_dir, args.tracemalloc)
+    stats['lines'] = len(lines)
+    stats['lines_per_second'] = len(lines) / stats['seconds'] if stats['seconds'] else 0.0
+    stages.append(stats)
+
+    # Shopping list for a plan of plan_meals meals, what Generate Meal Plan does
+    rng = random.Random(args.seed)
+    titles = sorted(recipes)
+    days = WeekMealPlanner.plan_days(num_days=args.plan_meals, workdays_only=False)
+    plan = [WeekMealPlanner.PlannedMeal(day, 'Lunch', rng.choice(titles), 2) for day in days]
+    shopping_list, stats = run_stage('aggregate', lambda: WeekMealPlanner.plan_shopping_list(plan, recipes),
+                                     profile_dir, args.tracemalloc)
+    stats['median_ms'], stats['best_ms'] = time_repeated(lambda: WeekMealPlanner.plan_shopping_list(plan, recipes), args.repeats)
+    stats['items'] = len(shopping_list)
+    stages.append(stats)
+
+    if args.optimize:
+        slots = [(day, 'Lunch', 2) for day in days[:min(len(days), len(titles))]]
+        _, stats = run_stage('optimize', lambda: WeekMealPlanner.optimize_plan(slots, {'Lunch': recipes}, num_plans=1),
+                             profile_dir, args.tracemalloc)
+        stages.append(stats)
+
+    return stages
+
+def print_results(stages):
+    print(f"{'stage':<18} {'seconds':>8} {'peak MB':>8}  details")
+    for stats in stages:
+        peak = f"{stats['peak_mb']:.1f}" if 'peak_mb' in stats else '-'
+        details = ', '.join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in stats.items() if key not in ('stage', 'seconds', 'peak_mb', 'profile'))
+        print(f"{stats['stage']:<18} {stats['seconds']:>8.3f} {peak:>8}  {details}")
+    profiles = [stats['profile'] for stats in stages if 'profile' in stats]
+    if profiles:
+        print(f"Profiles written to {os.path.dirname(profiles[0])}, read them with: python -m pstats <file>")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WeekMealPlanner on a synthetic Obsidian vault.")
+    parser.add_argument('--vault-dir', default=None, help="Folder for the generated vault (default: a temp folder)")
+    parser.add_argument('--notes', type=int, default=2000, help="Number of notes to generate")
+    parser.add_argument('--depth', type=int, default=3, help="Levels of nested folders")
+    parser.add_argument('--fanout', type=int, default=4, help="Subfolders per folder")
+    parser.add_argument('--tagged-share', type=float, default=0.3, help="Share of notes tagged #LunchSalad")
+    parser.add_argument('--min-ingredients', type=int, default=4, help="Fewest ingredient lines per note")
+    parser.add_argument('--max-ingredients', type=int, default=15, help="Most ingredient lines per note")
+    parser.add_argument('--touched', type=float, default=0.05, help="Share of notes changed before the incremental start")
+    parser.add_argument('--plan-meals', type=int, default=21, help="Meals in the plan for the aggregation stage")
+    parser.add_argument('--repeats', type=int, default=50, help="Repeats of the aggregation stage")
+    parser.add_argument('--optimize', action='store_true', help="Also time the plan optimizer")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for the vault")
+    parser.add_argument('--profile', default=None, help="Write a cProfile dump per stage to this folder")
+    parser.add_argument('--tracemalloc', action='store_true', help="Track the peak memory per stage (slows every stage down)")
+    parser.add_argument('--json', default=None, help="Write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the planner")
+    args = parser.parse_args()
+
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        vault_dir = args.vault_dir or os.path.join(temp_dir, 'vault')
+        folders = generate_vault(vault_dir, args.notes, args.depth, args.fanout, args.tagged_share,
+                                 args.min_ingredients, args.max_ingredients, args.seed)
+        print(f"Generated {args.notes} notes in {len(folders)} folders in {vault_dir}")
+        stages = run_benchmark(vault_dir, os.path.join(temp_dir, 'index.json'), args, args.profile)
+
+    print_results(stages)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'vault': vars(args), 'stages': stages}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import ExtractRACI
+from Instrumentation import peak_rss_mb
+
+# Page size in points (A4) and the layout of the generated tables
+page_width, page_height = 595, 842
+cell_width, cell_height = 60, 16
+
+role_names = ['Ward', 'Anna', 'Bram', 'Chris', 'Dana', 'Eva', 'Finn', 'Greta']
+filler_words = ['project', 'contract', 'delivery', 'scope', 'review', 'budget', 'planning', 'quality', 'the', 'of', 'and']
+
+def escape_pdf_text(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def text_ops(x, y, text, size=8):
+    return f"BT /F1 {size} Tf {x:.1f} {y:.1f} Td ({escape_pdf_text(text)}) Tj ET\n"
+
+def table_ops(rows, x0=40, y_top=780):
+    # Ruled grid with one line per cell border, the kind of table lattice detects
+    num_rows, num_cols = len(rows), len(rows[0])
+    x1 = x0 + num_cols * cell_width
+    y_bottom = y_top - num_rows * cell_height
+    ops = []
+    for r in range(num_rows + 1):
+        y = y_top - r * cell_height
+        ops.append(f"{x0} {y} m {x1} {y} l S\n")
+    for c in range(num_cols + 1):
+        x = x0 + c * cell_width
+        ops.append(f"{x} {y_top} m {x} {y_bottom} l S\n")
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            if cell:
+                ops.append(text_ops(x0 + c * cell_width + 3, y_top - (r + 1) * cell_height + 5, cell))
+    return ''.join(ops)
+
+def paragraph_ops(rng, lines=30, y_top=800):
+    ops = []
+    for i in range(lines):
+        words = ' '.join(rng.choice(filler_words) for _ in range(12))
+        ops.append(text_ops(40, y_top - i * 14, words, size=10))
+    return ''.join(ops)
+
+def raci_rows(rng, num_rows, num_roles):
+    roles = role_names[:num_roles]
+    rows = [['Task'] + roles]
+    for i in range(num_rows):
+        rows.append([f"Task {i + 1}"] + [rng.choice(['R', 'A', 'C', 'I', '']) for _ in roles])
+    return rows
+
+def other_rows(rng, num_rows):
+    rows = [['Item', 'Qty', 'Price', 'Note']]
+    for i in range(num_rows):
+        rows.append([f"Item {i + 1}", str(rng.randint(1, 50)), f"{rng.uniform(1, 500):.2f}", rng.choice(filler_words)])
+    return rows
+
+def build_pdf(page_streams):
+    # Minimal PDF 1.4 writer: one Helvetica font and one content stream per page
+    objects = [None, None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for stream in page_streams:
+        data = stream.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(data) + data + b'\nendstream')
+        content_id = len(objects)
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+                       % (page_width, page_height, content_id))
+        page_ids.append(len(objects))
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % i for i in page_ids), len(page_ids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref_offset = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+def generate_corpus(folder, num_pdfs=10, pages=5, raci_tables=1, other_tables=1, rows=12, roles=5, seed=42):
+    # Writes num_pdfs synthetic PDFs with one table per page at most, the rest filler text
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for old_pdf in glob.glob(os.path.join(folder, 'synthetic_*.pdf')):
+        os.remove(old_pdf)
+
+    tables_per_pdf = min(raci_tables + other_tables, pages)
+    for n in range(num_pdfs):
+        kinds = (['raci'] * raci_tables + ['other'] * other_tables)[:tables_per_pdf]
+        table_pages = dict(zip(rng.sample(range(pages), tables_per_pdf), kinds))
+        streams = []
+        for page in range(pages):
+            kind = table_pages.get(page)
+            if kind == 'raci':
+                streams.append(table_ops(raci_rows(rng, rows, roles)))
+            elif kind == 'other':
+                streams.append(table_ops(other_rows(rng, rows)))
+            else:
+                streams.append(paragraph_ops(rng))
+        with open(os.path.join(folder, f"synthetic_{n:04d}.pdf"), 'wb') as f:
+            f.write(build_pdf(streams))
+
+    return sorted(glob.glob(os.path.join(folder, 'synthetic_*.pdf')))
+
+def run_benchmark(pdf_files, output_dir, workers, options, output_format='csv', verbose=False):
+    output = os.path.join(output_dir, f"bench_{workers}.{output_format}")
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        run_stats, _ = ExtractRACI.run_extraction(pdf_files, output, output_format, workers=workers, options=options)
+
+    seconds = run_stats['total_seconds']
+    # Skipped pages count as handled, that's the whole point of the pre-screen
+    pages = run_stats['pages_parsed'] + run_stats['pages_skipped']
+    # Peaks over the lifetime of the process, see run_isolated
+    own_rss, worker_rss = peak_rss_mb(), peak_rss_mb(children=True)
+    run_stats.update({
+        'workers': workers,
+        'pages_per_second': pages / seconds if seconds else 0.0,
+        'tables_per_second': run_stats['tables_found'] / seconds if seconds else 0.0,
+        'peak_rss_mb': own_rss,
+        'peak_worker_rss_mb': worker_rss,
+    })
+    return run_stats
+
+def run_isolated(pdf_files, output_dir, workers, options, output_format='csv', verbose=False):
+    # Every configuration runs in a freshly spawned process, the peak RSS would
+    # otherwise carry over from the configurations that ran before it
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_benchmark, pdf_files, output_dir, workers, options, output_format, verbose).result()
+
+def print_results(results):
+    print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'tables/s':>9} {'rss MB':>7} {'worker MB':>9}"
+          f" {'screen':>7} {'extract':>8} {'filter':>7} {'concat':>7} {'write':>7}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-'
+        worker_rss = f"{r['peak_worker_rss_mb']:.0f}" if r['peak_worker_rss_mb'] is not None else '-'
+        print(f"{r['workers']:>7} {r['total_seconds']:>8.2f} {r['pages_per_second']:>8.1f} {r['tables_per_second']:>9.1f}"
+              f" {rss:>7} {worker_rss:>9} {r['screen_seconds']:>7.2f} {r['extract_seconds']:>8.2f}"
+              f" {r['filter_seconds']:>7.2f} {r['concat_seconds']:>7.2f} {r['write_seconds']:>7.2f}")
+    print("Stage timings are summed over all jobs, so with several workers they add up to more than the wall time.")
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    # Flags every worker count whose throughput dropped more than tolerance
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r['workers']: r for r in json.load(f)['results']}
+
+    regressions = []
+    for r in results:
+        old = baseline.get(r['workers'])
+        if old and old['pages_per_second'] and r['pages_per_second'] < old['pages_per_second'] * (1 - tolerance):
+            regressions.append(r['workers'])
+            print(f"REGRESSION with {r['workers']} workers: {r['pages_per_second']:.1f} pages/s, "
+                  f"baseline {old['pages_per_second']:.1f} pages/s")
+    if not regressions:
+        print(f"No regressions against {baseline_path}.")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ExtractRACI on a synthetic PDF corpus.")
+    parser.add_argument('--corpus-dir', default=None, help="Folder for the generated PDFs (default: a temp folder)")
+    parser.add_argument('--pdfs', type=int, default=20, help="Number of PDFs to generate")
+    parser.add_argument('--pages', type=int, default=5, help="Pages per PDF")
+    parser.add_argument('--raci-tables', type=int, default=1, help="RACI tables per PDF")
+    parser.add_argument('--other-tables', type=int, default=1, help="Non-RACI tables per PDF")
+    parser.add_argument('--rows', type=int, default=12, help="Rows per table")
+    parser.add_argument('--roles', type=int, default=5, help="Role columns per RACI table")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for the corpus")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="Worker counts to benchmark")
+    parser.add_argument('--prescreen', action='store_true', help="Benchmark with the page pre-screen on")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="Output format")
+    parser.add_argument('--json', default=None, help="Write the results to this JSON file")
+    parser.add_argument('--baseline', default=None, help="Compare against a JSON file from an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed drop in pages/s before a regression is reported")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the extraction runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = args.corpus_dir or os.path.join(temp_dir, 'corpus')
+        pdf_files = generate_corpus(corpus_dir, args.pdfs, args.pages, args.raci_tables, args.other_tables,
+                                    args.rows, args.roles, args.seed)
+        print(f"Generated {len(pdf_files)} PDFs with {args.pages} pages each in {corpus_dir}")
+
+        options = {'prescreen': args.prescreen}
+        results = [run_isolated(pdf_files, temp_dir, workers, options, args.format, args.verbose) for workers in args.workers]
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'corpus': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline and compare_to_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,202 +1,763 @@
-import tiktoken
-import os
-import win32com.client
-import openai
-import datetime
-
-def estimate_cost(prompt_tokens, completion_tokens, model="gpt-4"):
-    # Updated pricing as per OpenAI's API pricing (as of October 2023)
-    if model == "gpt-4":
-        prompt_cost_per_1k_tokens = 0.03   # $0.03 per 1K prompt tokens
-        completion_cost_per_1k_tokens = 0.06  # $0.06 per 1K completion tokens
-    elif model == "gpt-4-32k":
-        prompt_cost_per_1k_tokens = 0.06   # $0.06 per 1K prompt tokens
-        completion_cost_per_1k_tokens = 0.12  # $0.12 per 1K completion tokens
-    elif model == "gpt-3.5-turbo":
-        prompt_cost_per_1k_tokens = 0.0015  # $0.0015 per 1K prompt tokens
-        completion_cost_per_1k_tokens = 0.002  # $0.002 per 1K completion tokens
-    elif model == "gpt-3.5-turbo-16k":
-        prompt_cost_per_1k_tokens = 0.003  # $0.003 per 1K prompt tokens
-        completion_cost_per_1k_tokens = 0.004  # $0.004 per 1K completion tokens
-    elif model == "gpt-4o-mini":
-        prompt_cost_per_1k_tokens = 0.000075  # $0.000075 per 1K prompt tokens
-        completion_cost_per_1k_tokens = 0.00030  # $0.00030 per 1K completion tokens
-    else:
-        # Default pricing if model is unrecognized
-        prompt_cost_per_1k_tokens = 0.03
-        completion_cost_per_1k_tokens = 0.06
-
-    total_prompt_cost = (prompt_tokens / 1000) * prompt_cost_per_1k_tokens
-    total_completion_cost = (completion_tokens / 1000) * completion_cost_per_1k_tokens
-    total_cost = total_prompt_cost + total_completion_cost
-    return total_cost
-
-def get_email_data(num_emails=1000):
-    try:
-        # Connect to Outlook
-        outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
-        
-        # Access the inbox folder
-        inbox = outlook.GetDefaultFolder(6)  # 6 refers to the inbox folder
-        messages = inbox.Items
-        total_emails = messages.Count  # Get the total number of emails
-        messages.Sort("[ReceivedTime]", True)  # Sort by received time, newest first
-
-        # Retrieve the latest emails
-        email_data = []
-        count = 0
-        message = messages.GetFirst()
-        while message and count < num_emails:
-            # Get importance level
-            importance = message.Importance  # 0: Low, 1: Normal, 2: High
-            importance_str = {0: "Low", 1: "Normal", 2: "High"}.get(importance, "Normal")
-
-            # Get the email body
-            body = message.Body
-            if body:
-                body = body.strip().replace('\r', '').replace('\n', ' ')
-                body = body[:5000]  # Limit body to first 500 characters
-            else:
-                body = "No content."
-
-            # Append sender's name, subject, importance, and body
-            email_data.append({
-                "sender": message.SenderName,
-                "subject": message.Subject,
-                "importance": importance_str,
-                "body": body
-            })
-            message = messages.GetNext()
-            count += 1
-
-        return email_data, total_emails  # Return both email data and total emails
-    except Exception as e:
-        print("Error accessing Outlook:", e)
-        return [], 0
-
-def generate_summary(email_data):
-    try:
-        # Prepare the data for the prompt
-        summaries = []
-        for item in email_data:
-            sender = item['sender']
-            subject = item['subject']
-            importance = item['importance']
-            body = item['body']
-
-            if importance == "High":
-                # Include body for urgent emails
-                urgency = "[URGENT] "
-                email_summary = f"From: {sender}\nSubject: {urgency}{subject}\nBody: {body}\n"
-            else:
-                # Do not include body for non-urgent emails
-                email_summary = f"From: {sender}\nSubject: {subject}\n"
-
-            summaries.append(email_summary)
-
-        # Combine all email summaries
-        combined_summaries = "\n".join(summaries)
-
-        # Calculate token estimate using tiktoken
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        prompt_tokens = len(encoding.encode(combined_summaries))
-
-        # Check the length of the combined summaries
-        if prompt_tokens > 80000:  # Adjust based on model's context limit
-            return "The combined email content is too long to process."
-
-        # Craft the prompt for ChatGPT
-        prompt = (
-            "Based on the following emails, summarize the most important topics and people I should focus on today, "
-            "highlighting any urgent matters:\n\n"
-            f"{combined_summaries}\n"
-            "Provide a concise summary that helps me prioritize my (Ward van Genesen) responses."
-        )
-
-        # Recalculate prompt tokens including the full prompt
-        prompt_tokens = len(encoding.encode(prompt))
-
-        # Estimate completion tokens (max_tokens)
-        completion_tokens = 500  # Adjust as needed
-
-        # Estimate cost
-        total_cost = estimate_cost(prompt_tokens, completion_tokens, model="gpt-4o-mini")
-
-        # Retrieve the API key from the environment variable
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        if not openai.api_key:
-            raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
-
-        # Send the prompt to ChatGPT
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=completion_tokens,
-            temperature=0.7,
-        )
-
-        # Extract the assistant's reply
-        summary = response.choices[0].message.content.strip()
-
-        # Include the cost estimate in the output
-        print(f"Estimated cost of running the script: ${total_cost:.4f}")
-
-        return summary
-
-    except Exception as e:
-        print("Error generating summary:", e)
-        return "Could not generate a summary."
-
-def write_to_daily_note(summary):
-    import pathlib
-
-    # **Update these variables according to your setup**
-    vault_path = r"C:\Users\wardv\iCloudDrive\[4]Obsidian\Ward"  # Replace with your Obsidian vault path
-    daily_notes_folder = "Daily Notes"  # Replace if your daily notes are in a different folder
-
-    # Get today's date
-    today = datetime.date.today()
-    # Format the filename, assuming "YYYY-MM-DD.md"
-    filename = today.strftime("%Y-%m-%d") + ".md"
-
-    # Full path to the daily note file
-    daily_note_path = os.path.join(vault_path, daily_notes_folder, filename)
-
-    # Write the summary to the daily note
-    try:
-        # Check if the daily note file exists
-        if not os.path.exists(daily_note_path):
-            # Create the file if it doesn't exist
-            with open(daily_note_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {today.strftime('%Y-%m-%d')}\n\n")  # Optionally write a title
-
-        # Append the summary to the daily note
-        with open(daily_note_path, 'a', encoding='utf-8') as f:
-            f.write("\n## Email Summary\n\n")
-            f.write(summary)
-            f.write("\n")
-        print(f"Summary successfully written to {daily_note_path}")
-    except Exception as e:
-        print("Error writing to daily note:", e)
-
-def main():
-    # Fetch email data including sender, subject, importance, and body
-    email_data, total_emails = get_email_data()
-
-    print(f"Total number of emails in the inbox: {total_emails}")
-
-    if email_data:
-        # Generate a summary using ChatGPT
-        summary = generate_summary(email_data)
-
-        # Write the summary to the Obsidian daily note
-        write_to_daily_note(summary)
-
-        print(summary)
-    else:
-        print("No emails to process.")
-
-if __name__ == "__main__":
-    main()
+import tiktoken
+import os
+import openai
+import datetime
+import argparse
+import hashlib
+import sqlite3
+import json
+import time
+import asyncio
+import math
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import Instrumentation
+import ObsidianVault
+
+# Price per 1K prompt and completion tokens, as per OpenAI's API pricing (as of October 2023)
+model_pricing = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4o-mini": (0.000075, 0.00030),
+}
+
+# Default pricing if model is unrecognized
+default_pricing = (0.03, 0.06)
+
+def estimate_cost(prompt_tokens, completion_tokens, model="gpt-4"):
+    prompt_cost_per_1k_tokens, completion_cost_per_1k_tokens = model_pricing.get(model, default_pricing)
+    total_prompt_cost = (prompt_tokens / 1000) * prompt_cost_per_1k_tokens
+    total_completion_cost = (completion_tokens / 1000) * completion_cost_per_1k_tokens
+    return total_prompt_cost + total_completion_cost
+
+class CostLedger:
+    # Actual token usage of every API call in a run, priced per model
+    def __init__(self):
+        self.entries = []
+
+    def record(self, model, kind, prompt_tokens, completion_tokens):
+        self.entries.append({
+            "model": model,
+            "kind": kind,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": estimate_cost(prompt_tokens, completion_tokens, model),
+        })
+
+    def totals(self):
+        return {
+            "calls": len(self.entries),
+            "prompt_tokens": sum(entry["prompt_tokens"] for entry in self.entries),
+            "completion_tokens": sum(entry["completion_tokens"] for entry in self.entries),
+            "cost": sum(entry["cost"] for entry in self.entries),
+        }
+
+# Characters of the body kept per email
+body_limit = 5000
+
+# Only these properties are read from Outlook, in one call per row
+outlook_columns = ["EntryID", "SenderName", "SenderEmailAddress", "Subject", "Importance", "ReceivedTime",
+                   "ConversationID"]
+
+importance_names = {0: "Low", 1: "Normal", 2: "High"}
+
+_encoding = None
+
+def get_encoding():
+    # Loading the encoder is slow, so do it once per run
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.encoding_for_model("gpt-4")
+    return _encoding
+
+def count_tokens(text):
+    with Instrumentation.span('tiktoken_encode'):
+        return len(get_encoding().encode(text))
+
+class OutlookMailbox:
+    # Reads the inbox through an Outlook Table, which only loads the columns we ask
+    # for instead of opening every item. Bodies are only fetched when needed.
+    def __init__(self):
+        import win32com.client
+
+        self.namespace = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+        self.inbox = self.namespace.GetDefaultFolder(6)  # 6 refers to the inbox folder
+        self.total_emails = self.inbox.Items.Count
+
+    def fetch(self, num_emails, since=None, body_importance=(2,)):
+        restriction = ""
+        if since:
+            restriction = f"[ReceivedTime] >= '{since.strftime('%m/%d/%Y %I:%M %p')}'"
+        table = self.inbox.GetTable(restriction) if restriction else self.inbox.GetTable()
+        table.Sort("[ReceivedTime]", True)  # Sort by received time, newest first
+        table.Columns.RemoveAll()
+        for column in outlook_columns:
+            table.Columns.Add(column)
+
+        count = 0
+        while not table.EndOfTable and count < num_emails:
+            entry_id, sender, sender_address, subject, importance, received, conversation_id = table.GetNextRow().GetValues()
+            body = None
+            if importance in body_importance:
+                with Instrumentation.span('outlook_body'):
+                    body = self.namespace.GetItemFromID(entry_id).Body or ""
+                if body:
+                    # Cut early so huge bodies don't travel through the pipeline,
+                    # twice the limit leaves room for the \r characters cleanup drops
+                    body = body[:body_limit * 2]
+            yield {
+                "entry_id": entry_id,
+                "sender": sender,
+                "sender_address": sender_address,
+                "subject": subject,
+                "importance": importance,
+                "received": str(received),
+                "body": body,
+                "conversation_id": conversation_id,
+            }
+            count += 1
+
+class FixtureMailbox:
+    # Local stand-in for Outlook: a JSON list of emails with the same keys as
+    # OutlookMailbox.fetch yields, newest first. Handy for testing without Windows.
+    def __init__(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            self.messages = json.load(f)
+        self.total_emails = len(self.messages)
+
+    def fetch(self, num_emails, since=None, body_importance=(2,)):
+        count = 0
+        for message in self.messages:
+            if count >= num_emails:
+                break
+            if since and datetime.datetime.fromisoformat(message["received"]) < since:
+                continue
+            message = dict(message)
+            message["body"] = (message.get("body") or "") if message["importance"] in body_importance else None
+            yield message
+            count += 1
+
+def prepare_email(message):
+    # Runs on a worker thread: cleans up the body and counts the tokens
+    importance_str = importance_names.get(message["importance"], "Normal")
+
+    body = message["body"]
+    if body:
+        body = body.strip().replace('\r', '').replace('\n', ' ')
+        body = body[:body_limit]
+    elif body is not None:
+        body = "No content."
+
+    item = {
+        "entry_id": message.get("entry_id"),
+        "sender": message["sender"],
+        "sender_address": message.get("sender_address") or "",
+        "subject": message["subject"],
+        "importance": importance_str,
+        "received": message.get("received"),
+        "body": body,
+        "conversation_id": message.get("conversation_id"),
+    }
+    item["tokens"] = count_tokens(format_email(item))
+    return item
+
+def get_email_data(num_emails=1000, mailbox=None, since=None, workers=4):
+    # Fetching stays on this thread (COM objects belong to the thread that made
+    # them), while cleanup and tokenizing run on a thread pool in the meantime
+    try:
+        if mailbox is None:
+            mailbox = OutlookMailbox()
+
+        get_encoding()
+        with Instrumentation.span('fetch_emails'), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(prepare_email, message) for message in mailbox.fetch(num_emails, since)]
+            email_data = [future.result() for future in futures]
+        Instrumentation.count('emails_fetched', len(email_data))
+
+        return email_data, mailbox.total_emails  # Return both email data and total emails
+    except Exception as e:
+        print("Error accessing Outlook:", e)
+        return [], 0
+
+def format_email(item):
+    thread = ""
+    if item.get('thread_size', 1) > 1:
+        thread = f"Thread: {item['thread_size']} messages\n"
+        others = [sender for sender in item.get('senders', []) if sender != item['sender']]
+        if others:
+            thread += f"Also from: {', '.join(others)}\n"
+    if item['importance'] == "High":
+        # Include body for urgent emails
+        urgency = "[URGENT] "
+        return f"From: {item['sender']}\nSubject: {urgency}{item['subject']}\n{thread}Body: {item['body']}\n"
+    # Do not include body for non-urgent emails
+    return f"From: {item['sender']}\nSubject: {item['subject']}\n{thread}"
+
+# Emails kept in the prompt after triage, the rest only show up in the counts
+triage_top_n = 100
+
+# RE:/FW: prefixes, including the Dutch and German ones Outlook uses
+reply_prefix_pattern = re.compile(r'^\s*(?:re|fw|fwd|aw|wg|antw|doorst)\s*(?:\[\d+\])?\s*:\s*', re.IGNORECASE)
+
+# Sender names or addresses of newsletters and automated mail
+automated_sender_pattern = re.compile(
+    r'no-?reply|do-?not-?reply|newsletter|nieuwsbrief|notification|notifications|mailer|digest|'
+    r'updates?@|info@|news@|marketing|alerts?@|automated|postmaster',
+    re.IGNORECASE)
+
+importance_weights = {"High": 3.0, "Normal": 1.0, "Low": 0.5}
+
+def normalize_subject(subject):
+    # The subject without its RE:/FW: prefixes, and whether there were any
+    subject = subject or ""
+    is_reply = False
+    while True:
+        stripped = reply_prefix_pattern.sub('', subject, count=1)
+        if stripped == subject:
+            return subject.strip().lower(), is_reply
+        subject = stripped
+        is_reply = True
+
+def is_automated(item):
+    return bool(automated_sender_pattern.search(f"{item['sender']} {item.get('sender_address', '')}"))
+
+def triage_emails(email_data, top_n=triage_top_n):
+    # Shrinks the prompt before it reaches the model: threads become one entry,
+    # automated mail only counts, and only the top_n most salient emails are listed.
+    # Returns the emails to list and a text with the counts of everything else.
+    automated = Counter()
+    candidates = []
+    threads = {}
+    for item in email_data:
+        if is_automated(item) and item['importance'] != "High":
+            automated[item['sender']] += 1
+            continue
+        # Outlook's ConversationID ties a thread together. Without it (fixtures) the
+        # subject does, but only for replies and forwards: two emails that are both
+        # called "Question" are not one thread, and an empty subject never is.
+        subject, is_reply = normalize_subject(item['subject'])
+        if item.get('conversation_id'):
+            key = ('conversation', item['conversation_id'])
+            joins = key in threads
+        else:
+            key = ('subject', subject) if subject else None
+            # A thread takes in replies, plus the one email that started it
+            joins = key in threads and (is_reply or not threads[key]['has_original'])
+        # Emails are newest first, so the first one seen is the latest in the thread
+        if joins:
+            latest = threads[key]['item']
+            latest['thread_size'] += 1
+            if item['sender'] not in latest['senders']:
+                latest['senders'].append(item['sender'])
+            if importance_weights.get(item['importance'], 1.0) > importance_weights.get(latest['importance'], 1.0):
+                latest['importance'] = item['importance']
+                latest['body'] = item['body']
+            latest['tokens'] = None  # format changed, count again when packing
+        else:
+            latest = dict(item, thread_size=1, senders=[item['sender']])
+            candidates.append(latest)
+            if key:
+                threads[key] = {'item': latest, 'has_original': False}
+        if key and not is_reply:
+            threads[key]['has_original'] = True
+
+    sender_counts = Counter(item['sender'] for item in candidates)
+    count = len(candidates)
+
+    def score(position, item):
+        recency = 1 - position / count
+        return (importance_weights.get(item['importance'], 1.0) * 2 + recency
+                + math.log1p(sender_counts[item['sender']]) + 0.5 * math.log1p(item['thread_size'] - 1))
+
+    ranked = sorted(range(count), key=lambda position: score(position, candidates[position]), reverse=True)
+    keep = sorted(ranked[:top_n])  # back to inbox order
+    selected = [candidates[position] for position in keep]
+
+    aggregates = []
+    skipped = count - len(selected)
+    if skipped:
+        skipped_senders = Counter(sender for position in ranked[top_n:] for sender in candidates[position]['senders'])
+        top_skipped = ", ".join(f"{sender} ({n})" for sender, n in skipped_senders.most_common(5))
+        aggregates.append(f"{skipped} lower priority conversations not listed, mostly from: {top_skipped}")
+    if automated:
+        top_automated = ", ".join(f"{sender} ({n})" for sender, n in automated.most_common(5))
+        aggregates.append(f"{sum(automated.values())} newsletters and automated emails, mostly from: {top_automated}")
+    threaded = len(email_data) - sum(automated.values()) - count
+    if threaded:
+        aggregates.append(f"{threaded} earlier messages of a conversation were merged into its latest one")
+
+    return selected, "\n".join(aggregates)
+
+# Local record of the emails that already made it into a summary
+default_store_path = os.path.join(os.path.expanduser("~"), ".email_digest.sqlite")
+
+class ProcessedStore:
+    # SQLite store keyed by EntryID, so a run only sends emails that weren't
+    # summarized before and builds on the digest of earlier runs that day
+    def __init__(self, path=default_store_path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS emails (
+                email_key TEXT PRIMARY KEY,
+                sender TEXT,
+                subject TEXT,
+                importance TEXT,
+                received TEXT,
+                digest TEXT,
+                summarized_at TEXT,
+                tokens INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS summaries (
+                day TEXT PRIMARY KEY,
+                summary TEXT,
+                email_count INTEGER,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS usage (
+                day TEXT,
+                model TEXT,
+                kind TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cost REAL
+            );
+        """)
+        # Stores made before token counts were kept
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(emails)")]
+        if "tokens" not in columns:
+            self.connection.execute("ALTER TABLE emails ADD COLUMN tokens INTEGER")
+
+    @staticmethod
+    def email_key(item):
+        if item.get("entry_id"):
+            return item["entry_id"]
+        # Fixtures without an EntryID still get a stable key
+        raw = f"{item['sender']}|{item['subject']}|{item.get('received')}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def last_received(self):
+        row = self.connection.execute("SELECT MAX(received) FROM emails").fetchone()
+        if not row or not row[0]:
+            return None
+        return datetime.datetime.fromisoformat(row[0]).replace(tzinfo=None)
+
+    def filter_new(self, email_data):
+        new_emails = []
+        for item in email_data:
+            found = self.connection.execute(
+                "SELECT 1 FROM emails WHERE email_key = ?", (self.email_key(item),)).fetchone()
+            if not found:
+                new_emails.append(item)
+        return new_emails
+
+    def latest_summary(self, day):
+        row = self.connection.execute("SELECT summary FROM summaries WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else None
+
+    def save_summary(self, day, summary, email_data):
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO emails "
+                "(email_key, sender, subject, importance, received, digest, summarized_at, tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.email_key(item), item["sender"], item["subject"], item["importance"],
+                  item.get("received"), format_email(item), now, item.get("tokens")) for item in email_data])
+            self.connection.execute(
+                "INSERT INTO summaries VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET summary = excluded.summary, "
+                "email_count = summaries.email_count + excluded.email_count, updated_at = excluded.updated_at",
+                (day, summary, len(email_data), now))
+
+    def save_usage(self, day, ledger):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?)",
+                [(day, entry["model"], entry["kind"], entry["prompt_tokens"], entry["completion_tokens"], entry["cost"])
+                 for entry in ledger.entries])
+
+    def close(self):
+        self.connection.close()
+
+# generate_summary returns this instead of raising
+summary_failures = ("Could not generate a summary.",)
+
+summary_model = "gpt-4o-mini"
+
+# Emails are packed into chunks of at most this many tokens; inboxes that fit in
+# one chunk are summarized with a single call
+chunk_token_budget = 12000
+
+# Summary calls running at the same time
+max_concurrency = 4
+
+# max_tokens of the final summary and of every partial summary
+completion_tokens = 500
+partial_completion_tokens = 300
+
+class OpenAIClient:
+    # Thin async wrapper around the OpenAI API, anything with the same complete()
+    # coroutine returning (text, prompt_tokens, completion_tokens) can be passed
+    # to generate_summary instead
+    def __init__(self, model=summary_model):
+        # Retrieve the API key from the environment variable
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        if not openai.api_key:
+            raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+        self.model = model
+
+    async def complete(self, prompt, max_tokens, temperature=0.7):
+        with Instrumentation.span('openai_api'):
+            response = await openai.ChatCompletion.acreate(
+                model=self.model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        # Extract the assistant's reply and the tokens actually billed
+        return response.choices[0].message.content.strip(), response.usage.prompt_tokens, response.usage.completion_tokens
+
+class DryRunClient:
+    # Doesn't call the API, handy together with --fixture. Reports the prompt
+    # size and max_tokens as usage, so the ledger shows the worst case.
+    model = summary_model
+
+    async def complete(self, prompt, max_tokens, temperature=0.7):
+        prompt_tokens = count_tokens(prompt)
+        return f"[dry run] {prompt_tokens} prompt tokens, max {max_tokens} completion tokens", prompt_tokens, max_tokens
+
+# Completions are reused for this long, and at most this many are kept
+default_cache_path = os.path.join(os.path.expanduser("~"), ".email_response_cache.sqlite")
+cache_ttl_hours = 24
+cache_max_entries = 500
+
+class CachedClient:
+    # On-disk cache in front of another client, keyed by a hash of the model,
+    # the call parameters and the prompt. A rerun with the same prompts returns
+    # straight from disk, and cache hits are recorded as zero tokens.
+    def __init__(self, client=None, path=default_cache_path, ttl_hours=cache_ttl_hours,
+                 max_entries=cache_max_entries, model=summary_model):
+        # Without a client the OpenAI client is only made on the first miss, so a
+        # fully cached run doesn't even need the API key
+        self.client = client
+        self.model = client.model if client else model
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                text TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+
+    def cache_key(self, prompt, max_tokens, temperature):
+        raw = json.dumps([self.model, max_tokens, temperature, prompt])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        row = self.connection.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        text, created_at = row
+        now = time.time()
+        with self.connection:
+            if now - created_at > self.ttl_seconds:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return text
+
+    def put(self, key, text):
+        now = time.time()
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, text, now, now))
+            # Least recently used entries go first once the cache is full
+            self.connection.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+
+    async def complete(self, prompt, max_tokens, temperature=0.7):
+        key = self.cache_key(prompt, max_tokens, temperature)
+        text = self.get(key)
+        if text is not None:
+            self.hits += 1
+            return text, 0, 0
+
+        self.misses += 1
+        if self.client is None:
+            self.client = OpenAIClient(self.model)
+        text, prompt_tokens, completion_tokens = await self.client.complete(prompt, max_tokens, temperature)
+        self.put(key, text)
+        return text, prompt_tokens, completion_tokens
+
+    def close(self):
+        self.connection.close()
+
+def build_prompt(combined_summaries, previous_summary=None):
+    if previous_summary:
+        # Only the new emails are sent, merged into the digest of the earlier run
+        return (
+            "This is the summary of the emails I already received today:\n\n"
+            f"{previous_summary}\n\n"
+            "Update it with the following new emails, keeping the most important topics and people I should "
+            "focus on today and highlighting any urgent matters:\n\n"
+            f"{combined_summaries}\n"
+            "Provide a concise summary that helps me prioritize my (Ward van Genesen) responses."
+        )
+    return (
+        "Based on the following emails, summarize the most important topics and people I should focus on today, "
+        "highlighting any urgent matters:\n\n"
+        f"{combined_summaries}\n"
+        "Provide a concise summary that helps me prioritize my (Ward van Genesen) responses."
+    )
+
+def build_chunk_prompt(combined_summaries):
+    return (
+        "Summarize the following emails as a short list of the topics, people and urgent matters they contain. "
+        "The list will be combined with summaries of my other emails later.\n\n"
+        f"{combined_summaries}\n"
+    )
+
+def build_reduce_prompt(partial_summaries, previous_summary=None):
+    combined = "\n\n".join(partial_summaries)
+    prefix = ""
+    if previous_summary:
+        prefix = f"This is the summary of the emails I already received today:\n\n{previous_summary}\n\n"
+    return (
+        f"{prefix}"
+        "Based on the following summaries of groups of my emails, summarize the most important topics and people "
+        "I should focus on today, highlighting any urgent matters:\n\n"
+        f"{combined}\n"
+        "Provide a concise summary that helps me prioritize my (Ward van Genesen) responses."
+    )
+
+def pack_chunks(texts, token_counts, budget=chunk_token_budget):
+    # Greedy packing in inbox order using the token counts known up front, so the
+    # budget is checked while packing instead of by encoding the finished prompt.
+    # A text bigger than the budget gets its own chunk.
+    chunks = []
+    current, current_tokens = [], 0
+    for text, tokens in zip(texts, token_counts):
+        # +1 for the newline that joins the texts
+        if current and current_tokens + tokens + 1 > budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def summarize_all(prompts, client, max_tokens, ledger, kind, concurrency=max_concurrency):
+    # Runs the prompts concurrently, never more than `concurrency` at a time
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(prompt):
+        async with semaphore:
+            with Instrumentation.span(f'summarize_{kind}'):
+                text, prompt_tokens, completion_tokens = await client.complete(prompt, max_tokens)
+        ledger.record(client.model, kind, prompt_tokens, completion_tokens)
+        return text
+
+    return await asyncio.gather(*(summarize(prompt) for prompt in prompts))
+
+async def map_reduce_summary(email_data, previous_summary, client, budget, concurrency, ledger, aggregates=None):
+    texts = [format_email(item) for item in email_data]
+    # Reuse the counts made while fetching, only count what's missing
+    token_counts = [item.get("tokens") or count_tokens(text) for item, text in zip(email_data, texts)]
+    if aggregates:
+        texts.append(f"Not listed above:\n{aggregates}\n")
+        token_counts.append(count_tokens(texts[-1]))
+
+    # The fixed part of a prompt is counted once, the emails are added to it
+    single_overhead = count_tokens(build_prompt("", previous_summary))
+    if sum(token_counts) + len(texts) + single_overhead <= budget:
+        prompt = build_prompt("\n".join(texts), previous_summary)
+        return (await summarize_all([prompt], client, completion_tokens, ledger, "summary", concurrency))[0]
+
+    # Map: one partial summary per chunk of emails
+    chunk_overhead = count_tokens(build_chunk_prompt(""))
+    chunks = pack_chunks(texts, token_counts, budget - chunk_overhead)
+    print(f"Summarizing {len(email_data)} emails in {len(chunks)} chunks...")
+    prompts = [build_chunk_prompt("\n".join(chunk)) for chunk in chunks]
+    partials = await summarize_all(prompts, client, partial_completion_tokens, ledger, "chunk", concurrency)
+
+    # Reduce: combine partial summaries in groups until they fit in one prompt.
+    # Every round leaves fewer partials, and with one left there is nothing to
+    # combine anymore: a long previous summary can keep even that over budget.
+    reduce_overhead = count_tokens(build_reduce_prompt([], previous_summary))
+    partial_counts = [count_tokens(partial) for partial in partials]
+    while len(partials) > 1 and sum(partial_counts) + 2 * len(partials) + reduce_overhead > budget:
+        groups = pack_chunks(partials, partial_counts, budget - chunk_overhead)
+        if len(groups) == len(partials):
+            # Every partial fills a chunk on its own, merging pairs is the only way down
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        prompts = [build_chunk_prompt("\n\n".join(group)) for group in groups]
+        partials = await summarize_all(prompts, client, partial_completion_tokens, ledger, "combine", concurrency)
+        partial_counts = [count_tokens(partial) for partial in partials]
+
+    if sum(partial_counts) + 2 * len(partials) + reduce_overhead > budget:
+        print("The final prompt is over the chunk budget because of today's earlier summary, sending it anyway.")
+    prompt = build_reduce_prompt(partials, previous_summary)
+    return (await summarize_all([prompt], client, completion_tokens, ledger, "summary", concurrency))[0]
+
+def generate_summary(email_data, previous_summary=None, client=None, budget=chunk_token_budget,
+                     concurrency=max_concurrency, ledger=None, aggregates=None):
+    try:
+        if client is None:
+            client = OpenAIClient()
+        if ledger is None:
+            ledger = CostLedger()
+
+        summary = asyncio.run(map_reduce_summary(email_data, previous_summary, client, budget, concurrency, ledger,
+                                                       aggregates))
+
+        # Include the actual cost in the output
+        totals = ledger.totals()
+        print(f"Cost of running the script ({totals['calls']} calls, {totals['prompt_tokens']} prompt and "
+              f"{totals['completion_tokens']} completion tokens): ${totals['cost']:.4f}")
+
+        return summary
+
+    except Exception as e:
+        print("Error generating summary:", e)
+        return summary_failures[0]
+
+def write_to_daily_note(summary, vault_path=None):
+    # **Update these variables according to your setup**
+    vault_path = vault_path or r"C:\Users\wardv\iCloudDrive\[4]Obsidian\Ward"  # Replace with your Obsidian vault path
+    daily_notes_folder = "Daily Notes"  # Replace if your daily notes are in a different folder
+
+    # Get today's date
+    today = datetime.date.today()
+    # Format the filename, assuming "YYYY-MM-DD.md"
+    filename = today.strftime("%Y-%m-%d") + ".md"
+
+    # The summary replaces the one from an earlier run today (it already includes
+    # those emails), the rest of the note is left alone
+    try:
+        with Instrumentation.span('write_daily_note'), ObsidianVault.VaultWriter(vault_path) as vault:
+            vault.set_section(os.path.join(daily_notes_folder, filename), "## Email Summary", summary,
+                              title=f"# {today.strftime('%Y-%m-%d')}")
+        print(f"Summary successfully written to {os.path.join(vault_path, daily_notes_folder, filename)}")
+        return True
+    except Exception as e:
+        print("Error writing to daily note:", e)
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the latest inbox emails into the Obsidian daily note.")
+    parser.add_argument('--num-emails', type=int, default=1000, help="Maximum number of emails to read")
+    parser.add_argument('--since-hours', type=float, default=None, help="Only read emails received in the last N hours")
+    parser.add_argument('--fixture', default=None, help="Read emails from a JSON file instead of Outlook")
+    parser.add_argument('--store', default=default_store_path, help="SQLite file that remembers which emails were summarized")
+    parser.add_argument('--full', action='store_true', help="Ignore the store and summarize all fetched emails")
+    parser.add_argument('--dry-run', action='store_true', help="Don't call the OpenAI API, only show the prompt sizes")
+    parser.add_argument('--vault', default=None, help="Obsidian vault to write the daily note to (default: the one in the script)")
+    parser.add_argument('--response-cache', default=default_cache_path, help="SQLite file with cached API responses")
+    parser.add_argument('--no-response-cache', action='store_true', help="Always call the API, even for prompts seen before")
+    parser.add_argument('--cache-ttl-hours', type=float, default=cache_ttl_hours, help="How long cached responses are reused")
+    parser.add_argument('--top-n', type=int, default=triage_top_n, help="Emails listed in the prompt after triage")
+    parser.add_argument('--no-triage', action='store_true', help="List every email in the prompt")
+    parser.add_argument('--metrics', default=None, help="Append the run's stage timings and counters to this JSON lines file, or write a Prometheus textfile when it ends in .prom")
+    args = parser.parse_args()
+    Instrumentation.configure('email_digest')
+
+    mailbox = FixtureMailbox(args.fixture) if args.fixture else None
+    store = None if args.full else ProcessedStore(args.store)
+    today = datetime.date.today().isoformat()
+
+    since = None
+    if args.since_hours:
+        since = datetime.datetime.now() - datetime.timedelta(hours=args.since_hours)
+    if store:
+        # No need to fetch what an earlier run already saw, the overlap at the
+        # boundary is filtered out by EntryID below
+        last_received = store.last_received()
+        if last_received and (since is None or last_received > since):
+            since = last_received
+
+    # Fetch email data including sender, subject, importance, and body
+    email_data, total_emails = get_email_data(args.num_emails, mailbox=mailbox, since=since)
+
+    print(f"Total number of emails in the inbox: {total_emails}")
+
+    previous_summary = None
+    if store:
+        fetched = len(email_data)
+        with Instrumentation.span('store_filter'):
+            email_data = store.filter_new(email_data)
+        Instrumentation.count('emails_new', len(email_data))
+        previous_summary = store.latest_summary(today)
+        print(f"{len(email_data)} of {fetched} fetched emails are new.")
+
+    if email_data:
+        # Generate a summary using ChatGPT
+        client = None
+        if args.dry_run:
+            client = DryRunClient()
+        elif not args.no_response_cache:
+            client = CachedClient(path=args.response_cache, ttl_hours=args.cache_ttl_hours)
+        # Triage only shapes the prompt, every fetched email still counts as processed
+        prompt_emails, aggregates = email_data, None
+        if not args.no_triage:
+            with Instrumentation.span('triage'):
+                prompt_emails, aggregates = triage_emails(email_data, args.top_n)
+            print(f"Triage kept {len(prompt_emails)} of {len(email_data)} emails for the prompt.")
+
+        ledger = CostLedger()
+        with Instrumentation.span('generate_summary'):
+            summary = generate_summary(prompt_emails, previous_summary, client=client, ledger=ledger, aggregates=aggregates)
+        Instrumentation.count('emails_in_prompt', len(prompt_emails))
+        for key, value in ledger.totals().items():
+            Instrumentation.count(f'llm_{key}', value)
+
+        if isinstance(client, CachedClient):
+            print(f"Response cache: {client.hits} hits, {client.misses} misses.")
+            Instrumentation.count('response_cache_hits', client.hits)
+            Instrumentation.count('response_cache_misses', client.misses)
+            client.close()
+
+        failed = summary in summary_failures
+        if not args.dry_run:
+            # Write the summary to the Obsidian daily note first: if that fails the
+            # emails aren't marked as done, and the rerun is served from the cache.
+            # A failed summary is never written, it would replace today's good one.
+            written = False
+            if failed:
+                print("The summary failed, the daily note is left as it was. Run the script again to retry.")
+            else:
+                written = write_to_daily_note(summary, args.vault)
+
+            if store:
+                # Failed runs can still have paid for some calls
+                store.save_usage(today, ledger)
+                if written:
+                    store.save_summary(today, summary, email_data)
+
+        print(summary)
+    elif previous_summary:
+        print("No new emails, today's summary is unchanged.")
+        print(previous_summary)
+    else:
+        print("No emails to process.")
+
+    if store:
+        store.close()
+
+    if args.metrics:
+        Instrumentation.export(args.metrics)
+
+if __name__ == "__main__":
+    main()
@@ -2,56 +2,686 @@ import camelot
 import pandas as pd
 import os
 import glob
+import argparse
+import hashlib
+import json
+import csv
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pypdf import PdfReader
 
-def check_for_single_letters(df):
-    for column in df.columns:
-        for cell in df[column]:
-            if str(cell) in ['R', 'I', 'A', 'C']:
-                return True
-    return False
+import Instrumentation
 
-try:
-    pdf_folder_path = '/Users/ward/Documents/Extract RACIs/PDFs/'
-    combined_csv_path = '/Users/ward/Documents/Extract RACIs/combined_RACIs.csv'
+# Default locations, can be overridden on the command line
+pdf_folder_path = '/Users/ward/Documents/Extract RACIs/PDFs/'
+combined_csv_path = '/Users/ward/Documents/Extract RACIs/combined_RACIs.csv'
 
-    pdf_files = glob.glob(f"{pdf_folder_path}*.pdf")
-    print(f"Found {len(pdf_files)} PDF files.")
+# PDFs with more pages than this are split into page chunks so one large PDF
+# is spread over several workers instead of holding up the whole batch
+pages_per_chunk = 20
 
-    dfs_to_concat = []
+# Settings passed to camelot, part of the cache key so changing them re-extracts
+camelot_settings = {'flavor': 'lattice'}
 
+# Cell values pandas.read_csv turns into NaN by default
+csv_na_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                 '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Letters that mark a responsibility cell, per matrix type
+marker_sets = {
+    'RACI': ['R', 'A', 'C', 'I'],
+    'RASCI': ['R', 'A', 'S', 'C', 'I'],
+    'DACI': ['D', 'A', 'C', 'I'],
+}
+
+# Extraction options shared by every worker, all of them are part of the cache key
+default_options = {
+    'header_mode': 'first-row',
+    'marker_set': 'RACI',
+    # Share of the filled cells in a column that must be markers to count as a role column
+    'threshold': 0.5,
+    'min_role_columns': 1,
+    # Skip pages whose text layer and drawing operators can't hold a RACI table
+    'prescreen': False,
+    'min_marker_tokens': 3,
+    'min_ruling_lines': 4,
+}
+
+# Counters and timings every extraction job reports, summed over the run
+job_stat_keys = ['pages_parsed', 'pages_skipped', 'tables_found', 'tables_kept',
+                 'screen_seconds', 'extract_seconds', 'filter_seconds']
+
+# Rectangle and line-to operators in a PDF content stream, the ruling lines lattice looks for
+ruling_line_pattern = re.compile(rb'\s(?:re|l)\s')
+
+def marker_pattern(markers):
+    # A single marker, or combined ones like 'R/A' or 'A, C'
+    marker = '(?:' + '|'.join(re.escape(m) for m in markers) + ')'
+    return re.compile(rf'{marker}(?:\s*[/,&]\s*{marker})*')
+
+def marker_mask(df, markers):
+    # One vectorized pass over all cells: True where a cell holds only markers
+    cells = pd.Series(df.astype(str).to_numpy().ravel()).str.strip()
+    is_marker = cells.str.fullmatch(marker_pattern(markers)).to_numpy(dtype=bool)
+    is_filled = ~cells.isin(['', 'nan', 'None']).to_numpy(dtype=bool)
+    return is_marker.reshape(df.shape), is_filled.reshape(df.shape)
+
+def raci_statistics(df, markers=marker_sets['RACI'], threshold=0.5, min_role_columns=1):
+    # Per-table numbers used to decide whether a table is a RACI matrix. Stray
+    # single letters in a text column don't make it a role column, because most
+    # of the column's filled cells have to be markers
+    if df.empty:
+        return {'marker_cells': 0, 'density': 0.0, 'role_columns': [], 'task_rows': [], 'is_raci': False}
+
+    is_marker, is_filled = marker_mask(df, markers)
+    marker_counts = is_marker.sum(axis=0)
+    filled_counts = is_filled.sum(axis=0)
+    column_share = marker_counts / filled_counts.clip(min=1)
+    role_mask = (marker_counts > 0) & (column_share >= threshold)
+
+    role_columns = [column for column, is_role in zip(df.columns, role_mask) if is_role]
+    task_mask = is_marker[:, role_mask].any(axis=1)
+    task_rows = [int(i) for i in task_mask.nonzero()[0]]
+
+    return {
+        'marker_cells': int(is_marker.sum()),
+        'density': float(is_marker.sum() / df.size),
+        'role_columns': role_columns,
+        'task_rows': task_rows,
+        'is_raci': len(role_columns) >= min_role_columns and len(task_rows) > 0,
+    }
+
+def check_for_single_letters(df, markers=marker_sets['RACI']):
+    is_marker, _ = marker_mask(df, markers)
+    return bool(is_marker.any())
+
+def dedup_column_names(names):
+    # Same renaming pandas.read_csv (C parser) does for repeated headers: 'R',
+    # 'R.1', 'R.2', ... skipping suffixed names that are already in the header
+    header = set(names)
+    counts = {}
+    deduped = []
+    for name in names:
+        original = name
+        cur_count = counts.get(name, 0)
+        while cur_count > 0:
+            counts[original] = cur_count + 1
+            name = f"{original}.{cur_count}"
+            if name in header:
+                cur_count += 1
+            else:
+                cur_count = counts.get(name, 0)
+        deduped.append(name)
+        counts[name] = cur_count + 1
+    return deduped
+
+def promote_header(df):
+    # Gives the in-memory camelot frame the shape the old to_csv/read_csv round
+    # trip produced: first row as header, empty cells as NaN, numeric columns typed
+    header = [name if name != '' else f"Unnamed: {i}" for i, name in enumerate(df.iloc[0])]
+    body = df.iloc[1:].reset_index(drop=True)
+    body.columns = dedup_column_names(header)
+    body = body.mask(body.isin(csv_na_values))
+    for column in body.columns:
+        try:
+            body[column] = pd.to_numeric(body[column])
+        except (ValueError, TypeError):
+            pass
+    return body
+
+def table_to_frame(table, header_mode='first-row'):
+    # 'first-row' matches the columns of older combined CSVs, 'none' keeps the
+    # raw positional columns and skips the header work
+    df = table.df
+    if header_mode == 'first-row' and len(df):
+        return promote_header(df)
+    return df.copy()
+
+def page_numbers(pages, num_pages):
+    # '1-3,7' or 'all' as a list of 1-based page numbers
+    if pages == 'all':
+        return list(range(1, num_pages + 1))
+    numbers = []
+    for part in pages.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            end = num_pages if end == 'end' else int(end)
+            numbers.extend(range(int(start), end + 1))
+        else:
+            numbers.append(int(part))
+    return numbers
+
+def page_ranges(numbers):
+    # [1, 2, 3, 7] as '1-3,7', the format camelot takes
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+def could_hold_raci(page, markers, min_marker_tokens=3, min_ruling_lines=4):
+    # Cheap check on the text layer and the drawing operators of a page, a tiny
+    # fraction of what lattice detection costs
+    text = page.extract_text() or ''
+    marker = '|'.join(re.escape(m) for m in markers)
+    marker_tokens = len(re.findall(rf'(?<!\S)(?:{marker})(?!\S)', text))
+    if marker_tokens < min_marker_tokens:
+        return False
+
+    if min_ruling_lines:
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b''
+        if len(ruling_line_pattern.findall(data)) < min_ruling_lines:
+            return False
+    return True
+
+def prescreen_pages(pdf_file_path, pages, options):
+    # Returns the pages worth handing to camelot, as a camelot page string
+    reader = PdfReader(pdf_file_path)
+    markers = marker_sets[options['marker_set']]
+    numbers = page_numbers(pages, len(reader.pages))
+    candidates = [
+        number for number in numbers
+        if could_hold_raci(reader.pages[number - 1], markers, options['min_marker_tokens'], options['min_ruling_lines'])
+    ]
+    return page_ranges(candidates), len(numbers), len(candidates)
+
+def extract_raci_tables(pdf_file_path, pages='all', options=None, num_pages=None):
+    # Returns the number of tables camelot found, the RACI tables as (index, df)
+    # and the job's counters and stage timings. num_pages is only used for the
+    # page counter, split_into_jobs already knows it so the PDF isn't opened again.
+    options = {**default_options, **(options or {})}
+    markers = marker_sets[options['marker_set']]
+    job_stats = dict.fromkeys(job_stat_keys, 0)
+
+    if options['prescreen']:
+        start = time.perf_counter()
+        pages, num_pages, num_candidates = prescreen_pages(pdf_file_path, pages, options)
+        job_stats['screen_seconds'] = time.perf_counter() - start
+        job_stats['pages_parsed'] = num_candidates
+        job_stats['pages_skipped'] = num_pages - num_candidates
+        if not pages:
+            return 0, [], job_stats
+    elif pages != 'all':
+        job_stats['pages_parsed'] = len(page_numbers(pages, num_pages or 0))
+    elif num_pages:
+        job_stats['pages_parsed'] = num_pages
+
+    start = time.perf_counter()
+    tables = camelot.read_pdf(pdf_file_path, pages=pages, **camelot_settings)
+    job_stats['extract_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raci_tables = []
+    for i, table in enumerate(tables):
+        df = table_to_frame(table, options['header_mode'])
+        stats = raci_statistics(df, markers, options['threshold'], options['min_role_columns'])
+        if stats['is_raci']:
+            raci_tables.append((i, df))
+    job_stats['filter_seconds'] = time.perf_counter() - start
+    job_stats['tables_found'] = len(tables)
+    job_stats['tables_kept'] = len(raci_tables)
+
+    return len(tables), raci_tables, job_stats
+
+def annotate_table(df, pdf_name, table_index):
+    df['Source_PDF'] = pdf_name
+    df['Table_Index'] = table_index
+
+    # Rearrange the columns to put 'Source_PDF' and 'Table_Index' at the beginning
+    cols = ['Source_PDF', 'Table_Index'] + [col for col in df.columns if col not in ['Source_PDF', 'Table_Index']]
+    return df[cols]
+
+def count_pages(pdf_file_path):
+    return len(PdfReader(pdf_file_path).pages)
+
+def split_into_jobs(pdf_files, chunk_size=pages_per_chunk):
+    # Returns the (pdf, pages) jobs and the page count of every PDF
+    jobs = []
+    page_counts = {}
     for pdf_file_path in pdf_files:
-        print(f"Processing {pdf_file_path}...")
-        tables = camelot.read_pdf(pdf_file_path, flavor='lattice', pages='all')
-        pdf_name = os.path.splitext(os.path.basename(pdf_file_path))[0]
-        
-        for i, table in enumerate(tables):
-            print(f"  Processing table {i+1}...")
-            temp_csv_path = f'temp_table_{i}.csv'
-            table.to_csv(temp_csv_path)
-            
-            df = pd.read_csv(temp_csv_path)
-            has_single_letter = check_for_single_letters(df)
-            
-            if has_single_letter:
-                print(f"    Table {i+1} has single letters. Appending to list.")
-                df['Source_PDF'] = pdf_name
-                df['Table_Index'] = i
-                                
-                # Rearrange the columns to put 'Source_PDF' and 'Table_Index' at the beginning
-                cols = ['Source_PDF', 'Table_Index'] + [col for col in df.columns if col not in ['Source_PDF', 'Table_Index']]
-                df = df[cols]
-                
-                dfs_to_concat.append(df)
-
-            os.remove(temp_csv_path)
-
-    if dfs_to_concat:
-        print("Concatenating and saving DataFrame...")
-        master_df = pd.concat(dfs_to_concat, ignore_index=True)
-        master_df.to_csv(combined_csv_path, index=False)
-        print(f"Combined and saved all tables to {combined_csv_path}")
+        try:
+            num_pages = count_pages(pdf_file_path)
+        except Exception:
+            # Let camelot report the real problem when the job runs
+            num_pages = 0
+        page_counts[pdf_file_path] = num_pages
+
+        if chunk_size and num_pages > chunk_size:
+            for start in range(1, num_pages + 1, chunk_size):
+                end = min(start + chunk_size - 1, num_pages)
+                jobs.append((pdf_file_path, f"{start}-{end}"))
+        else:
+            jobs.append((pdf_file_path, 'all'))
+    return jobs, page_counts
+
+def stitch_tables(pdf_file_path, job_results):
+    # Put the chunks of one PDF back together in page order, so Table_Index counts
+    # the tables of the whole PDF just like a single pages='all' run would
+    pdf_name = os.path.splitext(os.path.basename(pdf_file_path))[0]
+    pdf_tables = []
+    offset = 0
+    for num_tables, raci_tables, _ in job_results:
+        for i, df in raci_tables:
+            pdf_tables.append(annotate_table(df, pdf_name, offset + i))
+        offset += num_tables
+    return pdf_tables
+
+def process_pdfs(pdf_files, workers=None, chunk_size=pages_per_chunk, options=None, on_pdf=None, run_stats=None):
+    # Calls on_pdf(pdf_file_path, tables) for every PDF in sorted order as soon as
+    # all of its jobs are done. Without on_pdf the tables are returned per PDF.
+    # The job counters and timings of the PDFs handed over are added to run_stats
+    # when it is given.
+    pdf_files = sorted(pdf_files)
+    with Instrumentation.span('split_into_jobs'):
+        jobs, page_counts = split_into_jobs(pdf_files, chunk_size)
+    print(f"Split {len(pdf_files)} PDF files into {len(jobs)} jobs.")
+
+    jobs_by_pdf = {}
+    for job in jobs:
+        jobs_by_pdf.setdefault(job[0], []).append(job)
+
+    tables_by_pdf = {}
+    if on_pdf is None:
+        def on_pdf(pdf_file_path, pdf_tables):
+            tables_by_pdf[pdf_file_path] = pdf_tables
+
+    if run_stats is None:
+        run_stats = {}
+    for key in job_stat_keys:
+        run_stats.setdefault(key, 0)
+
+    results = {}
+    errors = []
+    failed_pdfs = set()
+    pending_pdfs = list(jobs_by_pdf)
+
+    def record_error(job, e):
+        pdf_file_path, pages = job
+        print(f"  Failed on {pdf_file_path} (pages {pages}): {e}")
+        errors.append({'Source_PDF': os.path.basename(pdf_file_path), 'Pages': pages, 'Error': str(e)})
+        failed_pdfs.add(pdf_file_path)
+
+    def hand_over_finished():
+        # Results are dropped once handed over, so only out-of-order PDFs stay in memory
+        while pending_pdfs:
+            pdf_file_path = pending_pdfs[0]
+            if pdf_file_path not in failed_pdfs:
+                pdf_jobs = jobs_by_pdf[pdf_file_path]
+                if not all(job in results for job in pdf_jobs):
+                    break
+                pdf_results = [results.pop(job) for job in pdf_jobs]
+                # Counted on hand over, so the stats of a failed PDF's other chunks
+                # don't end up in the totals of tables that were never written
+                for result in pdf_results:
+                    for key, count in result[2].items():
+                        run_stats[key] += count
+                on_pdf(pdf_file_path, stitch_tables(pdf_file_path, pdf_results))
+            # Indices after a failed chunk can't be trusted, so a failed PDF is skipped entirely
+            pending_pdfs.pop(0)
+
+    def store_result(job, result):
+        # Jobs run in worker processes, so their stage timings come back in the
+        # job stats instead of being recorded there
+        for stage, key in [('prescreen', 'screen_seconds'), ('camelot_extract', 'extract_seconds'), ('raci_filter', 'filter_seconds')]:
+            if result[2][key]:
+                Instrumentation.add_time(stage, result[2][key])
+        if job[0] not in failed_pdfs:
+            results[job] = result
+        hand_over_finished()
+
+    if workers == 1:
+        # No pool needed, handy for debugging
+        for job in jobs:
+            print(f"Processing {job[0]} (pages {job[1]})...")
+            try:
+                store_result(job, extract_raci_tables(*job, options=options, num_pages=page_counts[job[0]]))
+            except Exception as e:
+                record_error(job, e)
+                hand_over_finished()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(extract_raci_tables, *job, options=options, num_pages=page_counts[job[0]]): job
+                       for job in jobs}
+            for future in as_completed(futures):
+                # A Future keeps its result, so drop every reference to it once the
+                # job is stored, otherwise all tables stay in memory until the end
+                job = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    record_error(job, e)
+                    hand_over_finished()
+                    continue
+                finally:
+                    del future
+                print(f"Finished {job[0]} (pages {job[1]}).")
+                store_result(job, result)
+                del result
+
+    for pdf_file_path in failed_pdfs:
+        for job in jobs_by_pdf[pdf_file_path]:
+            results.pop(job, None)
+
+    if run_stats['pages_skipped']:
+        print(f"Pre-screen: parsed {run_stats['pages_parsed']} pages, skipped {run_stats['pages_skipped']} pages.")
+
+    return tables_by_pdf, errors
+
+class CsvTableWriter:
+    # Appends tables to one CSV in chunks, so memory stays flat and the file is a
+    # valid CSV after every chunk. New columns widen the file in a streaming pass.
+    def __init__(self, path, chunk_rows=1000):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.columns = []
+        self.buffer = []
+        self.buffered_rows = 0
+        self.rows_written = 0
+        self.tables_written = 0
+        self.concat_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def write(self, df):
+        self.buffer.append(df)
+        self.buffered_rows += len(df)
+        self.tables_written += 1
+        if self.buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        start = time.perf_counter()
+        chunk = pd.concat(self.buffer, ignore_index=True)
+        self.buffer = []
+        self.buffered_rows = 0
+        self.concat_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_columns = [col for col in chunk.columns if col not in self.columns]
+        if new_columns and self.rows_written:
+            self.widen(self.columns + new_columns)
+        self.columns = self.columns + new_columns
+
+        first_chunk = self.rows_written == 0
+        chunk.reindex(columns=self.columns).to_csv(
+            self.path, mode='w' if first_chunk else 'a', header=first_chunk,
+            index=False, encoding='utf-8', lineterminator='\n')
+        self.rows_written += len(chunk)
+        self.write_seconds += time.perf_counter() - start
+
+    def widen(self, columns):
+        # Rewrite the header and pad the rows already written, line by line
+        temp_path = self.path + '.tmp'
+        padding = [''] * (len(columns) - len(self.columns))
+        with open(self.path, 'r', newline='', encoding='utf-8') as src, \
+                open(temp_path, 'w', newline='', encoding='utf-8') as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst, lineterminator='\n')
+            next(reader)
+            writer.writerow(columns)
+            for row in reader:
+                writer.writerow(row + padding)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        self.flush()
+
+class ParquetTableWriter:
+    # Writes every chunk as its own part file in a dataset folder, so a crash only
+    # loses the chunk in progress. Use read_parquet_output to load it back.
+    def __init__(self, path, chunk_rows=1000):
+        import pyarrow  # noqa: F401 - fail early when pyarrow isn't installed
+
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.buffer = []
+        self.buffered_rows = 0
+        self.parts_written = 0
+        self.rows_written = 0
+        self.tables_written = 0
+        self.concat_seconds = 0.0
+        self.write_seconds = 0.0
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('part-') and name.endswith('.parquet'):
+                os.remove(os.path.join(path, name))
+
+    def write(self, df):
+        self.buffer.append(df)
+        self.buffered_rows += len(df)
+        self.tables_written += 1
+        if self.buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        start = time.perf_counter()
+        chunk = pd.concat(self.buffer, ignore_index=True)
+        self.buffer = []
+        self.buffered_rows = 0
+        self.concat_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        # Parquet needs string column names, and one type per column across parts
+        chunk.columns = [str(col) for col in chunk.columns]
+        table_columns = [col for col in chunk.columns if col not in ['Source_PDF', 'Table_Index']]
+        chunk = chunk.astype({col: 'string' for col in table_columns})
+
+        part_path = os.path.join(self.path, f"part-{self.parts_written:05d}.parquet")
+        chunk.to_parquet(part_path + '.tmp', index=False)
+        os.replace(part_path + '.tmp', part_path)
+        self.parts_written += 1
+        self.rows_written += len(chunk)
+        self.write_seconds += time.perf_counter() - start
+
+    def close(self):
+        self.flush()
+
+def read_parquet_output(path):
+    # Loads a ParquetTableWriter folder, unifying the differing column sets of the parts
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    part_files = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+    schema = pa.unify_schemas([pq.read_schema(part_file) for part_file in part_files])
+    return ds.dataset(part_files, schema=schema, format='parquet').to_table().to_pandas()
+
+def make_writer(output_format, path, chunk_rows=1000):
+    if output_format == 'parquet':
+        return ParquetTableWriter(path, chunk_rows)
+    return CsvTableWriter(path, chunk_rows)
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read cache manifest, starting fresh: {e}")
+        return {}
+
+def save_manifest(cache_dir, manifest):
+    # Write to a temp file first so an interrupted run never leaves a broken manifest
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def process_pdfs_cached(pdf_files, cache_dir, workers=None, chunk_size=pages_per_chunk, options=None, on_pdf=None, run_stats=None):
+    # Only extracts PDFs that are new or changed since the last run, the accepted
+    # tables of every PDF are kept in cache_dir keyed by content hash and settings.
+    # Afterwards every PDF is read back from the cache one at a time, in sorted order.
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    settings = json.dumps({**camelot_settings, **default_options, **(options or {})}, sort_keys=True)
+
+    current_manifest = {}
+    hashes = {}
+    to_extract = []
+    for pdf_file_path in sorted(pdf_files):
+        key = os.path.basename(pdf_file_path)
+        with Instrumentation.span('hash_pdf'):
+            content_hash = file_hash(pdf_file_path)
+        entry = manifest.get(key)
+        if (entry and entry['hash'] == content_hash and entry['settings'] == settings
+                and os.path.exists(os.path.join(cache_dir, entry['cache_file']))):
+            current_manifest[key] = entry
+        else:
+            hashes[pdf_file_path] = content_hash
+            to_extract.append(pdf_file_path)
+
+    print(f"{len(current_manifest)} PDF files unchanged, {len(to_extract)} new or changed.")
+    Instrumentation.count('cache_hits', len(current_manifest))
+    Instrumentation.count('cache_misses', len(to_extract))
+
+    def store_in_cache(pdf_file_path, pdf_tables):
+        key = os.path.basename(pdf_file_path)
+        content_hash = hashes[pdf_file_path]
+        cache_file = hashlib.sha256(f"{key}|{content_hash}|{settings}".encode('utf-8')).hexdigest() + '.pkl'
+        pd.to_pickle(pdf_tables, os.path.join(cache_dir, cache_file))
+        current_manifest[key] = {
+            'hash': content_hash,
+            'settings': settings,
+            'cache_file': cache_file,
+            'raci_tables': len(pdf_tables),
+        }
+
+    errors = []
+    if to_extract:
+        _, errors = process_pdfs(to_extract, workers=workers, chunk_size=chunk_size, options=options, on_pdf=store_in_cache, run_stats=run_stats)
+
+    # Drop cached tables of deleted or changed PDFs
+    in_use = {entry['cache_file'] for entry in current_manifest.values()}
+    for entry in manifest.values():
+        if entry['cache_file'] not in in_use:
+            stale_path = os.path.join(cache_dir, entry['cache_file'])
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    save_manifest(cache_dir, current_manifest)
+
+    tables_by_pdf = {}
+    if on_pdf is None:
+        def on_pdf(key, pdf_tables):
+            tables_by_pdf[key] = pdf_tables
+
+    for key in sorted(current_manifest):
+        with Instrumentation.span('cache_read'):
+            pdf_tables = pd.read_pickle(os.path.join(cache_dir, current_manifest[key]['cache_file']))
+        on_pdf(key, pdf_tables)
+    return tables_by_pdf, errors
+
+def run_extraction(pdf_files, output, output_format='csv', chunk_rows=1000, workers=None,
+                   chunk_size=pages_per_chunk, options=None, cache_dir=None):
+    # The whole pipeline for a list of PDFs, without a cache when cache_dir is None.
+    # Returns the run statistics and the per-job errors.
+    start = time.perf_counter()
+    run_stats = {'pdfs': len(pdf_files)}
+    writer = make_writer(output_format, output, chunk_rows)
+
+    # Every PDF's tables go to the output as soon as they are ready
+    def write_pdf_tables(pdf_file_path, pdf_tables):
+        with Instrumentation.span('write_output'):
+            for df in pdf_tables:
+                writer.write(df)
+
+    if cache_dir is None:
+        _, errors = process_pdfs(pdf_files, workers=workers, chunk_size=chunk_size, options=options,
+                                 on_pdf=write_pdf_tables, run_stats=run_stats)
     else:
-        print("No tables with single letters found.")
-        
-except Exception as e:
-    print(f"An error occurred: {e}")
\ No newline at end of file
+        _, errors = process_pdfs_cached(pdf_files, cache_dir, workers=workers, chunk_size=chunk_size, options=options,
+                                        on_pdf=write_pdf_tables, run_stats=run_stats)
+    with Instrumentation.span('write_output'):
+        writer.close()
+
+    run_stats.update({
+        'tables_written': writer.tables_written,
+        'rows_written': writer.rows_written,
+        'concat_seconds': writer.concat_seconds,
+        'write_seconds': writer.write_seconds,
+        'errors': len(errors),
+        'total_seconds': time.perf_counter() - start,
+    })
+    Instrumentation.add_time('run_extraction', run_stats['total_seconds'])
+    for key in ['pdfs', 'pages_parsed', 'pages_skipped', 'tables_found', 'tables_kept', 'tables_written', 'rows_written', 'errors']:
+        Instrumentation.count(key, run_stats.get(key, 0))
+    return run_stats, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract RACI tables from a folder of PDFs into one CSV.")
+    parser.add_argument('--pdf-folder', default=pdf_folder_path, help="Folder containing the PDFs")
+    parser.add_argument('--output', default=combined_csv_path, help="Path of the combined CSV, or folder for --format parquet")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="Output format")
+    parser.add_argument('--chunk-rows', type=int, default=1000, help="Rows buffered before they are written to the output")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count, 1 = no pool)")
+    parser.add_argument('--pages-per-chunk', type=int, default=pages_per_chunk, help="Split PDFs with more pages into chunks of this size (0 = never split)")
+    parser.add_argument('--cache-dir', default=None, help="Folder for the extraction cache (default: .raci_cache in the PDF folder)")
+    parser.add_argument('--no-cache', action='store_true', help="Re-extract every PDF and don't touch the cache")
+    parser.add_argument('--header-mode', choices=['first-row', 'none'], default='first-row', help="Use the first table row as header like older runs did, or keep positional columns")
+    parser.add_argument('--marker-set', choices=sorted(marker_sets), default='RACI', help="Letters that mark a responsibility cell")
+    parser.add_argument('--threshold', type=float, default=default_options['threshold'], help="Share of filled cells that must be markers for a role column")
+    parser.add_argument('--min-role-columns', type=int, default=default_options['min_role_columns'], help="Role columns a table needs to be kept")
+    parser.add_argument('--prescreen', action='store_true', help="Only run lattice detection on pages whose text and ruling lines could hold a RACI table")
+    parser.add_argument('--min-marker-tokens', type=int, default=default_options['min_marker_tokens'], help="Standalone marker letters a page needs to pass the pre-screen")
+    parser.add_argument('--min-ruling-lines', type=int, default=default_options['min_ruling_lines'], help="Line/rectangle operators a page needs to pass the pre-screen (0 = don't check)")
+    parser.add_argument('--metrics', default=None, help="Append the run's stage timings and counters to this JSON lines file, or write a Prometheus textfile when it ends in .prom")
+    args = parser.parse_args()
+    Instrumentation.configure('extract_raci')
+
+    options = {
+        'header_mode': args.header_mode,
+        'marker_set': args.marker_set,
+        'threshold': args.threshold,
+        'min_role_columns': args.min_role_columns,
+        'prescreen': args.prescreen,
+        'min_marker_tokens': args.min_marker_tokens,
+        'min_ruling_lines': args.min_ruling_lines,
+    }
+
+    try:
+        pdf_files = glob.glob(os.path.join(args.pdf_folder, '*.pdf'))
+        print(f"Found {len(pdf_files)} PDF files.")
+
+        output = args.output
+        if args.format == 'parquet' and output.endswith('.csv'):
+            output = os.path.splitext(output)[0] + '.parquet'
+        cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(args.pdf_folder, '.raci_cache'))
+
+        run_stats, errors = run_extraction(pdf_files, output, args.format, args.chunk_rows, args.workers,
+                                           args.pages_per_chunk, options, cache_dir)
+
+        if run_stats['tables_written']:
+            print(f"Saved {run_stats['tables_written']} tables ({run_stats['rows_written']} rows) to {output}")
+        else:
+            print("No tables with single letters found.")
+
+        if errors:
+            errors_csv_path = os.path.splitext(args.output)[0] + '_errors.csv'
+            pd.DataFrame(errors).to_csv(errors_csv_path, index=False)
+            print(f"{len(errors)} jobs failed, see {errors_csv_path}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    if args.metrics:
+        Instrumentation.export(args.metrics)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from ObsidianVault import write_atomic
+
+# Per-stage timings, counters and memory high-water marks for the scripts.
+# Every script records into the module level `metrics` and exports it once at
+# the end of a run, as a JSON line (appended, one per run) or as a Prometheus
+# textfile (replaced, for the node exporter's textfile collector).
+#
+#   with Instrumentation.span('vault_scan'):
+#       files = scan_markdown_files(folder)
+#   Instrumentation.count('notes_read', len(files))
+#   Instrumentation.export('metrics.jsonl')
+
+def peak_rss_mb(children=False):
+    # Highest resident set size so far of this process, or of its largest child
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource:
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(who).ru_maxrss / scale
+    if children:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # Windows reports the peak working set
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024)
+
+class Metrics:
+    def __init__(self, job='python_scripts'):
+        self.job = job
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        # Wall time of the block. Spans with the same name add up, also when
+        # they run at the same time on several threads or tasks.
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        # For timings measured elsewhere, like in worker processes
+        rss = peak_rss_mb()
+        with self.lock:
+            stats = self.spans.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_rss_mb': None})
+            stats['calls'] += calls
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds / calls if calls else seconds)
+            # The process peak when the span ended, shows which stage pushed it up
+            if rss is not None:
+                stats['peak_rss_mb'] = max(stats['peak_rss_mb'] or 0, rss)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'job': self.job,
+                'timestamp': self.started,
+                'run_seconds': time.perf_counter() - self.start,
+                'peak_rss_mb': peak_rss_mb(),
+                'peak_child_rss_mb': peak_rss_mb(children=True),
+                'spans': {name: dict(stats) for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def write_jsonl(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        job = snapshot['job']
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{value}"' for key, value in [('job', job)] + labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        spans = sorted(snapshot['spans'].items())
+        metric('script_span_seconds_total', 'counter', "Time spent in each stage.",
+               [([('span', name)], stats['seconds']) for name, stats in spans])
+        metric('script_span_calls_total', 'counter', "Times each stage ran.",
+               [([('span', name)], stats['calls']) for name, stats in spans])
+        metric('script_span_max_seconds', 'gauge', "Longest single run of each stage.",
+               [([('span', name)], stats['max_seconds']) for name, stats in spans])
+        metric('script_span_peak_rss_bytes', 'gauge', "Peak RSS of the process when the stage ended.",
+               [([('span', name)], int(stats['peak_rss_mb'] * 1024 * 1024))
+                for name, stats in spans if stats['peak_rss_mb'] is not None])
+        metric('script_events_total', 'counter', "Counters of the run.",
+               [([('name', name)], value) for name, value in sorted(snapshot['counters'].items())])
+        metric('script_run_seconds', 'gauge', "Wall time of the run.", [([], snapshot['run_seconds'])])
+        metric('script_run_timestamp_seconds', 'gauge', "Start of the run.", [([], snapshot['timestamp'])])
+        for key, name in [('peak_rss_mb', 'script_peak_rss_bytes'), ('peak_child_rss_mb', 'script_peak_child_rss_bytes')]:
+            if snapshot[key] is not None:
+                metric(name, 'gauge', "Peak RSS of the run.", [([], int(snapshot[key] * 1024 * 1024))])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # The textfile collector may read at any moment, so write and rename
+        write_atomic(path, self.prometheus_text())
+
+    def export(self, path, output_format=None):
+        # The format follows the extension (.prom) unless it is given
+        output_format = output_format or ('prometheus' if path.endswith('.prom') else 'jsonl')
+        if output_format == 'prometheus':
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
+        print(f"Metrics written to {path}")
+
+metrics = Metrics()
+
+def configure(job):
+    # Starts a fresh run for a script
+    global metrics
+    metrics = Metrics(job)
+    return metrics
+
+def span(name):
+    return metrics.span(name)
+
+def add_time(name, seconds, calls=1):
+    metrics.add_time(name, seconds, calls)
+
+def count(name, value=1):
+    metrics.count(name, value)
+
+def export(path, output_format=None):
+    metrics.export(path, output_format)
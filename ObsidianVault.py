@@ -0,0 +1,148 @@
+import os
+import re
+import tempfile
+
+# The vaults live in iCloud Drive, which syncs a note on every close. Notes are
+# therefore read once, changed in memory and written back in one go: to a temp
+# file next to the note that is then renamed over it, so the sync never picks up
+# a half written note.
+
+heading_pattern = re.compile(r'^(#{1,6})\s+(.*?)\s*$')
+
+def write_atomic(path, content):
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def heading_level(heading):
+    match = heading_pattern.match(heading)
+    if not match:
+        raise ValueError(f"Not a Markdown heading: {heading!r}")
+    return len(match.group(1)), match.group(2)
+
+def find_sections(content, heading):
+    # [(start, end)] line ranges of every section with this heading, up to the
+    # next heading of the same or a higher level. Headings in code blocks don't count.
+    level, title = heading_level(heading)
+    lines = content.splitlines(keepends=True)
+    sections = []
+    start = None
+    in_code = False
+    for idx, line in enumerate(lines):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+            continue
+        match = None if in_code else heading_pattern.match(line)
+        if not match or len(match.group(1)) > level:
+            continue
+        if start is not None:
+            sections.append((start, idx))
+            start = None
+        if len(match.group(1)) == level and match.group(2) == title:
+            start = idx
+    if start is not None:
+        sections.append((start, len(lines)))
+    return lines, sections
+
+def demote_headings(body, level):
+    # Shifts the headings in body so the highest one is one level below the
+    # section, otherwise a '## Urgent' in an LLM summary would end the section
+    # early and survive the next replace
+    lines = body.splitlines(keepends=True)
+    levels = []
+    in_code = False
+    for line in lines:
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+            continue
+        match = None if in_code else heading_pattern.match(line)
+        if match:
+            levels.append(len(match.group(1)))
+    if not levels or min(levels) > level:
+        return body
+
+    shift = level + 1 - min(levels)
+    in_code = False
+    for idx, line in enumerate(lines):
+        if line.lstrip().startswith('```'):
+            in_code = not in_code
+            continue
+        match = None if in_code else heading_pattern.match(line)
+        if match:
+            lines[idx] = '#' * min(len(match.group(1)) + shift, 6) + line[len(match.group(1)):]
+    return ''.join(lines)
+
+def replace_section(content, heading, body):
+    # Puts body under heading: an existing section with that heading is replaced,
+    # otherwise the section is added at the end. Duplicates left by older scripts
+    # that appended are removed. Running it twice gives the same note.
+    section = f"{heading}\n\n{demote_headings(body.strip(), heading_level(heading)[0])}\n"
+    lines, sections = find_sections(content, heading)
+
+    if not sections:
+        if content and not content.endswith('\n'):
+            content += '\n'
+        return content + ('\n' if content.strip() else '') + section
+
+    (start, end), duplicates = sections[0], sections[1:]
+    for dup_start, dup_end in reversed(duplicates):
+        del lines[dup_start:dup_end]
+    after = ''.join(lines[end:]).lstrip('\n')
+    before = ''.join(lines[:start])
+    return (before + section + ('\n' + after if after.strip() else '')).rstrip('\n') + '\n'
+
+class VaultWriter:
+    # Collects section updates per note and writes each note once on flush.
+    # Notes whose content doesn't change are not written at all.
+    #
+    #   with VaultWriter(vault_path) as vault:
+    #       vault.set_section("Daily Notes/2024-05-01.md", "## Email Summary", summary, title="# 2024-05-01")
+    def __init__(self, vault_path):
+        self.vault_path = vault_path
+        self.pending = {}
+        self.written = []
+
+    def path(self, note):
+        return os.path.join(self.vault_path, note)
+
+    def set_section(self, note, heading, body, title=None):
+        # title is the first line of the note when it doesn't exist yet
+        updates = self.pending.setdefault(note, {'title': None, 'sections': []})
+        if title and not updates['title']:
+            updates['title'] = title
+        updates['sections'].append((heading, body))
+
+    def flush(self):
+        for note, updates in self.pending.items():
+            path = self.path(note)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    old_content = f.read()
+            except FileNotFoundError:
+                old_content = None
+
+            content = old_content
+            if content is None:
+                content = f"{updates['title']}\n" if updates['title'] else ''
+            for heading, body in updates['sections']:
+                content = replace_section(content, heading, body)
+
+            if content != old_content:
+                write_atomic(path, content)
+                self.written.append(path)
+        self.pending = {}
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
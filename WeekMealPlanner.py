@@ -1,297 +1,898 @@
-import os
-import re
-import yaml
-import tkinter as tk
-from tkinter import messagebox, ttk
-from datetime import datetime, timedelta
-
-# Global variables
-recipes_folder = r"C:\Users\wardv\iCloudDrive\[4]Obsidian\2 Areas\Koken"
-
-def get_lunch_salad_recipes():
-    lunch_salad_recipes = {}
-    for root, dirs, files in os.walk(recipes_folder):
-        for file in files:
-            if file.endswith(".md"):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if '#LunchSalad' in content:
-                        title = os.path.splitext(file)[0]
-                        ingredients, portions = extract_ingredients(content)
-                        # Default portion is 1 if not specified
-                        lunch_salad_recipes[title] = {
-                            'path': file_path,
-                            'ingredients': ingredients,
-                            'portions': portions if portions else 1
-                        }
-    return lunch_salad_recipes
-
-def extract_ingredients(content):
-    ingredients = []
-
-    # First try to find a 'portions' line
-    portions = None
-    portions_match = re.search(r'portions:\s*(\d+)', content, re.IGNORECASE)
-    if portions_match:
-        portions = int(portions_match.group(1))
-
-    # If ingredients not in YAML, fallback to Markdown section
-    # (We assume ingredients are listed under "## Ingredients")
-    ingredients_match = re.search(r'## Ingredients\s*(.*?)\n(##|\Z)', content, re.DOTALL)
-    if ingredients_match:
-        ingredients_text = ingredients_match.group(1)
-        ingredients = re.findall(r'-\s*(.+)', ingredients_text)
-
-    return ingredients, portions
-
-def normalize_fractions(text):
-    fractions_map = {
-        '½': '0.5',
-        '¼': '0.25',
-        '¾': '0.75'
-    }
-    for frac_char, decimal_str in fractions_map.items():
-        text = text.replace(frac_char, decimal_str)
-    return text
-
-def scale_ingredient(ingredient, factor):
-    ingredient = normalize_fractions(ingredient)
-    match = re.match(r"^(\d+(?:\.\d+)?)(.*)$", ingredient.strip())
-    if match:
-        quantity_str = match.group(1)
-        rest = match.group(2).strip()
-        quantity = float(quantity_str)
-        scaled_quantity = quantity * factor
-        if scaled_quantity.is_integer():
-            scaled_quantity = int(scaled_quantity)
-        return f"{scaled_quantity} {rest}".strip()
-    else:
-        # No numeric prefix found, return as is
-        return ingredient
-
-def parse_ingredient_line(line):
-    match = re.match(r'^(\d+(?:\.\d+)?)(.*)$', line.strip())
-    if match:
-        quantity_str = match.group(1)
-        description = match.group(2).strip()
-        quantity = float(quantity_str)
-        return quantity, description
-    else:
-        # No numeric quantity
-        return None, line.strip()
-
-def save_to_obsidian(meal_plan, shopping_list):
-    week_number = datetime.now().isocalendar()[1]
-    date_range = f"{(datetime.now()).strftime('%B %d')} - {(datetime.now() + timedelta(days=4)).strftime('%B %d')}"
-    meal_plan_content = f"# Weekly Meal Plan for Week {week_number}\n\n"
-    meal_plan_content += f"### Date Range: {date_range}\n\n"
-    meal_plan_content += "## Meals\n\n"
-    for day, recipe_title in meal_plan.items():
-        meal_plan_content += f"### {day}\n- Lunch: [[{recipe_title}]]\n\n"
-
-    meal_plan_content += "## Shopping List\n\n"
-    for item in shopping_list:
-        meal_plan_content += f"- {item}\n"
-
-    meal_plan_filename = f"Meal Plan Week {week_number}.md"
-    meal_plan_path = os.path.join(recipes_folder, meal_plan_filename)
-    with open(meal_plan_path, 'w', encoding='utf-8') as f:
-        f.write(meal_plan_content)
-    messagebox.showinfo("Success", f"Meal plan saved to {meal_plan_path}")
-
-class ToolTip:
-    def __init__(self, widget, text=''):
-        self.widget = widget
-        self.text = text
-        self.tipwindow = None
-        widget.bind('<Enter>', self.enter)
-        widget.bind('<Leave>', self.leave)
-
-    def enter(self, event=None):
-        self.showtip()
-
-    def leave(self, event=None):
-        self.hidetip()
-
-    def showtip(self):
-        if not self.text:
-            return
-
-        x = self.widget.winfo_rootx() + 20
-        y = self.widget.winfo_rooty() + self.widget.winfo_height() + 5
-
-        self.tipwindow = tw = tk.Toplevel(self.widget)
-        tw.wm_overrideredirect(1)  # Remove window decorations
-        tw.configure(bg="#ffffe0", padx=5, pady=5, relief="solid", borderwidth=1)
-        label = tk.Label(tw, text=self.text, bg="#ffffe0", wraplength=300)
-        label.pack()
-
-        tw.wm_geometry(f"+{x}+{y}")
-
-    def hidetip(self):
-        if self.tipwindow:
-            self.tipwindow.destroy()
-        self.tipwindow = None
-
-    def update_text(self, new_text):
-        self.text = new_text
-
-class MealPlannerApp:
-    def __init__(self, master):
-        self.master = master
-        master.title("Obsidian Meal Planner")
-
-        master.minsize(600, 400)
-        master.configure(bg="#d4f1c5", padx=30, pady=20)
-
-        self.style = ttk.Style()
-        self.style.theme_use("clam")
-
-        # Define custom styles
-        self.style.configure("Green.TFrame", background="#d4f1c5")
-        self.style.configure("Header.TFrame", background="#a5d6a7")
-        self.style.configure("Header.TLabel", background="#a5d6a7", foreground="#1b5e20", font=("Helvetica", 18, "bold"))
-        self.style.configure("Subtitle.TLabel", background="#a5d6a7", foreground="#2e7d32", font=("Helvetica", 10))
-        self.style.configure("Title.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 14))
-        self.style.configure("Bold.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 12, "bold"))
-        self.style.configure("Regular.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 12))
-        self.style.configure("Green.TButton", background="#4caf50", foreground="white", font=("Helvetica", 10))
-        self.style.map("Green.TButton",
-                       background=[("active", "#43a047")],
-                       foreground=[("active", "white")])
-        self.style.configure("TCombobox", fieldbackground="#ffffff")
-
-        # Load recipes
-        self.lunch_salad_recipes = get_lunch_salad_recipes()
-        self.recipe_titles = list(self.lunch_salad_recipes.keys())
-
-        # Meal plan dictionary
-        self.meal_plan = {}
-        self.selected_recipes = {}
-        self.day_portions = {}
-        self.tooltips = {}
-        self.days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-
-        # Create widgets
-        self.create_widgets()
-
-    def create_widgets(self):
-        # Header Frame
-        header_frame = ttk.Frame(self.master, style="Header.TFrame", padding=(0, 0, 0, 20))
-        header_frame.pack(fill='x')
-
-        title_label = ttk.Label(header_frame, text="Obsidian Meal Planner", style="Header.TLabel")
-        title_label.pack()
-        subtitle_label = ttk.Label(header_frame, text="Generate weekly meal plans and shopping lists", style="Subtitle.TLabel")
-        subtitle_label.pack()
-
-        # Instructions
-        instructions_label = ttk.Label(self.master, text="Select recipes and portions for each workday:", style="Title.TLabel")
-        instructions_label.pack(pady=10)
-
-        # Separator
-        separator = ttk.Separator(self.master, orient='horizontal')
-        separator.pack(fill='x', pady=10)
-
-        # Main selection frame (using grid)
-        selection_frame = ttk.Frame(self.master, style="Green.TFrame")
-        selection_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Add column headers
-        ttk.Label(selection_frame, text="Day", style="Bold.TLabel").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        ttk.Label(selection_frame, text="Recipe", style="Bold.TLabel").grid(row=0, column=1, padx=5, pady=5, sticky='w')
-        ttk.Label(selection_frame, text="Portions", style="Bold.TLabel").grid(row=0, column=2, padx=5, pady=5, sticky='w')
-
-        for idx, day in enumerate(self.days, start=1):
-            ttk.Label(selection_frame, text=day, style="Regular.TLabel").grid(row=idx, column=0, padx=5, pady=5, sticky='e')
-            var = tk.StringVar(value=self.recipe_titles[0] if self.recipe_titles else '')
-            self.selected_recipes[day] = var
-            option_menu = ttk.Combobox(selection_frame, textvariable=var, values=self.recipe_titles, state="readonly", width=40)
-            option_menu.grid(row=idx, column=1, padx=5, pady=5, sticky='w')
-
-            # Create a tooltip for the combobox
-            tooltip = ToolTip(option_menu, text=var.get())
-            self.tooltips[day] = tooltip
-            var.trace_add("write", lambda *args, v=var, t=tooltip: t.update_text(v.get()))
-
-            # Portion spinbox with default = 1
-            portion_var = tk.IntVar(value=1)
-            self.day_portions[day] = portion_var
-            portions_spin = ttk.Spinbox(selection_frame, from_=1, to=100, textvariable=portion_var, width=5)
-            portions_spin.grid(row=idx, column=2, padx=5, pady=5, sticky='w')
-
-        # Button frame at the bottom, aligned to the right
-        button_frame = ttk.Frame(self.master, style="Green.TFrame")
-        button_frame.pack(fill='x', pady=20)
-
-        button_frame.columnconfigure(0, weight=1)
-
-        self.generate_button = ttk.Button(button_frame, text="Generate Meal Plan", style="Green.TButton", command=self.generate_meal_plan)
-        self.generate_button.grid(row=0, column=1, padx=10, sticky='e')
-
-        self.exit_button = ttk.Button(button_frame, text="Exit", style="Green.TButton", command=self.master.quit)
-        self.exit_button.grid(row=0, column=2, padx=(10, 20), sticky='e')
-
-    def generate_meal_plan(self):
-        # Build meal plan dictionary
-        self.meal_plan = {}
-        for day in self.days:
-            recipe_title = self.selected_recipes[day].get()
-            if recipe_title:
-                self.meal_plan[day] = recipe_title
-
-        # Collect selected recipes info
-        selected_recipes_info = {title: self.lunch_salad_recipes[title] for title in self.meal_plan.values()}
-
-        # Dictionary to accumulate all ingredients: {description: total_quantity}
-        ingredient_totals = {}
-
-        for day, recipe_title in self.meal_plan.items():
-            recipe_data = selected_recipes_info[recipe_title]
-            default_portions = recipe_data.get('portions', 1)  # default to 1 if not found
-            desired_portions = self.day_portions[day].get()
-            factor = desired_portions / default_portions if default_portions else 1
-
-            for ingredient in recipe_data['ingredients']:
-                scaled_ingredient = scale_ingredient(ingredient, factor)
-                qty, desc = parse_ingredient_line(scaled_ingredient)
-
-                if desc not in ingredient_totals:
-                    ingredient_totals[desc] = qty
-                else:
-                    # If both are numeric, sum them
-                    if ingredient_totals[desc] is not None and qty is not None:
-                        ingredient_totals[desc] += qty
-                    else:
-                        # If one has no numeric value, we can't sum
-                        ingredient_totals[desc] = None
-
-        # Convert ingredient_totals back to a list of strings
-        final_shopping_list = []
-        for desc, total_qty in ingredient_totals.items():
-            if total_qty is not None:
-                # Format total qty (as int if whole number)
-                if float(total_qty).is_integer():
-                    total_qty = int(total_qty)
-                final_shopping_list.append(f"{total_qty} {desc}")
-            else:
-                # No numeric quantity
-                final_shopping_list.append(desc)
-
-        # Sort the list
-        final_shopping_list.sort()
-
-        # Confirm and save
-        confirm = messagebox.askyesno("Confirm", "Do you want to save the meal plan and shopping list to Obsidian?")
-        if confirm:
-            save_to_obsidian(self.meal_plan, final_shopping_list)
-
-
-def main():
-    root = tk.Tk()
-    app = MealPlannerApp(root)
-    root.mainloop()
-
-if __name__ == '__main__':
+import os
+import re
+import sys
+import json
+import heapq
+import yaml
+import queue
+import argparse
+import threading
+from datetime import datetime, timedelta
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import Instrumentation
+import ObsidianVault
+
+# Tk is only needed for the GUI, the plan command runs without a display
+try:
+    import tkinter as tk
+    from tkinter import messagebox, ttk
+except ImportError:
+    tk = None
+
+# Global variables
+recipes_folder = r"C:\Users\wardv\iCloudDrive\[4]Obsidian\2 Areas\Koken"
+
+# The recipe index lives outside the vault so iCloud doesn't sync it
+index_path = os.path.join(os.path.expanduser("~"), ".meal_planner_index.json")
+
+# Meal slots of a day and the tag(s) a recipe needs to be picked for it
+meal_slots = {'Lunch': 'LunchSalad'}
+
+# Pantry note with what is already in the house, one bullet per item
+pantry_path = os.path.join(recipes_folder, "Pantry.md")
+
+# Package sizes in grams or millilitres, for working out what is left over.
+# Items not listed get the default of their unit, pieces never leave waste.
+package_sizes = {'feta': 200, 'pasta': 500, 'rice': 1000, 'spinach': 300, 'milk': 1000, 'yoghurt': 500}
+default_package_sizes = {'g': 250, 'ml': 500}
+
+# How much a whole package left over weighs against buying one more item
+leftover_weight = 1.0
+
+# Bump when the parsed fields change, so every note is read again
+index_version = 2
+
+tag_pattern = re.compile(r'(?<![\w#&])#([A-Za-z][\w/-]*)')
+frontmatter_pattern = re.compile(r'\A---\s*\n(.*?)\n---', re.DOTALL)
+
+# One planned meal: a date, a meal slot, the recipe title and the portions to cook
+PlannedMeal = namedtuple('PlannedMeal', ['day', 'meal', 'title', 'portions'])
+
+def get_lunch_salad_recipes(tag='LunchSalad'):
+    files = refresh_recipe_index()
+    return find_recipes(files, build_tag_index(files), tag)
+
+def as_tag_list(tags):
+    # A slot can ask for one tag or for a list of tags that must all be present
+    return [tags] if isinstance(tags, str) else list(tags)
+
+def add_to_tag_index(tag_index, file_path, entry):
+    for tag in entry['tags']:
+        tag_index.setdefault(tag, set()).add(file_path)
+
+def build_tag_index(files):
+    # Inverted index {tag: {path}}, so any meal type is a lookup instead of a scan
+    tag_index = {}
+    for file_path, entry in files.items():
+        add_to_tag_index(tag_index, file_path, entry)
+    return tag_index
+
+def matching_paths(tag_index, tags):
+    tag_sets = [tag_index.get(tag, set()) for tag in as_tag_list(tags)]
+    if not tag_sets:
+        return set()
+    return set.intersection(*tag_sets)
+
+def find_recipes(files, tag_index, tags):
+    # {title: recipe} for every note carrying all of tags
+    return {files[file_path]['title']: recipe_from_entry(file_path, files[file_path])
+            for file_path in sorted(matching_paths(tag_index, tags))}
+
+def plan_days(start=None, num_days=5, workdays_only=True):
+    # The dates to plan. Without a start the plan begins on the Monday of this
+    # week, or of next week in the weekend.
+    if start is None:
+        today = datetime.now().date()
+        if today.weekday() >= 5:
+            start = today + timedelta(days=7 - today.weekday())
+        else:
+            start = today - timedelta(days=today.weekday())
+    days = []
+    day = start
+    while len(days) < num_days:
+        if not workdays_only or day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def candidates_by_title(candidates):
+    return {title: recipe for recipes in candidates.values() for title, recipe in recipes.items()}
+
+def day_label(day):
+    return day.strftime('%A %d %B')
+
+def plan_shopping_list(plan, recipes, pantry=None):
+    # plan: list of PlannedMeal, recipes: {title: recipe}. Meals that use the same
+    # recipe are folded into one portion factor first, so every recipe's parsed
+    # ingredients are walked only once however often it is planned.
+    factors = {}
+    for meal in plan:
+        recipe = recipes[meal.title]
+        default_portions = recipe.get('portions', 1)  # default to 1 if not found
+        factor = meal.portions / default_portions if default_portions else 1
+        factors[meal.title] = factors.get(meal.title, 0) + factor
+    return build_shopping_list([(recipes[title]['parsed'], factor) for title, factor in factors.items()], pantry)
+
+def recipe_from_entry(file_path, entry):
+    return {
+        'path': file_path,
+        'ingredients': entry['ingredients'],
+        'parsed': [Ingredient(*record) for record in entry['parsed']],
+        'portions': entry['portions']
+    }
+
+def extract_tags(content):
+    # Inline #tags plus the tags in the YAML front matter
+    tags = set(tag_pattern.findall(content))
+    frontmatter = frontmatter_pattern.match(content)
+    if frontmatter:
+        try:
+            data = yaml.safe_load(frontmatter.group(1)) or {}
+        except yaml.YAMLError:
+            data = {}
+        if isinstance(data, dict):
+            yaml_tags = data.get('tags') or []
+            if isinstance(yaml_tags, str):
+                yaml_tags = re.split(r'[,\s]+', yaml_tags)
+            tags.update(str(tag).lstrip('#') for tag in yaml_tags if tag)
+    return sorted(tags)
+
+def parse_recipe(file_path, content):
+    ingredients, portions = extract_ingredients(content)
+    return {
+        'title': os.path.splitext(os.path.basename(file_path))[0],
+        'tags': extract_tags(content),
+        'ingredients': ingredients,
+        # Parsed once here, so planning only adds numbers
+        'parsed': [list(parse_ingredient(line)) for line in ingredients],
+        # Default portion is 1 if not specified
+        'portions': portions if portions else 1
+    }
+
+def scan_markdown_files(folder):
+    # Stat pass over the vault: {path: (mtime, size)} without opening any file
+    files = {}
+    folders = [folder]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.name.endswith(".md"):
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime, stat.st_size)
+    return files
+
+def load_index(path, folder):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get('version') != index_version or index.get('folder') != folder:
+        return {}
+    return index['files']
+
+def save_index(path, folder, files):
+    # Written atomically so an interrupted save never leaves a broken index
+    ObsidianVault.write_atomic(path, json.dumps({'version': index_version, 'folder': folder, 'files': files}))
+
+def read_recipe(file_path, mtime, size):
+    try:
+        with Instrumentation.span('read_note'):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Skipping {file_path}: {e}")
+        return None
+    with Instrumentation.span('parse_recipe'):
+        return {'mtime': mtime, 'size': size, **parse_recipe(file_path, content)}
+
+def refresh_recipe_index(folder=None, path=None, workers=8, on_entry=None, on_progress=None):
+    # Returns {path: entry} for every note in the vault. Only notes whose mtime or
+    # size changed since the last run are read again, on a thread pool since
+    # reading from iCloud is mostly waiting. on_entry(path, entry) is called for
+    # every note as soon as it is known, on_progress(done, total) as notes finish.
+    folder = folder or recipes_folder
+    path = path or index_path
+    if not os.path.isdir(folder):
+        if on_progress:
+            on_progress(0, 0)
+        return {}
+
+    with Instrumentation.span('load_index'):
+        old_files = load_index(path, folder)
+    with Instrumentation.span('vault_scan'):
+        scanned = scan_markdown_files(folder)
+    files = {}
+    to_read = []
+    for file_path, (mtime, size) in scanned.items():
+        entry = old_files.get(file_path)
+        if entry and entry['mtime'] == mtime and entry['size'] == size:
+            files[file_path] = entry
+            if on_entry:
+                on_entry(file_path, entry)
+        else:
+            to_read.append((file_path, mtime, size))
+
+    total = len(files) + len(to_read)
+    done = len(files)
+    if on_progress:
+        on_progress(done, total)
+
+    changed = 0
+    if to_read:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(read_recipe, *item): item[0] for item in to_read}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                entry = future.result()
+                done += 1
+                if entry:
+                    files[file_path] = entry
+                    changed += 1
+                    if on_entry:
+                        on_entry(file_path, entry)
+                if on_progress:
+                    on_progress(done, total)
+
+    Instrumentation.count('notes_scanned', len(scanned))
+    Instrumentation.count('notes_read', len(to_read))
+    if changed or len(files) != len(old_files):
+        with Instrumentation.span('save_index'):
+            save_index(path, folder, files)
+    return files
+
+portions_pattern = re.compile(r'portions:\s*(\d+)', re.IGNORECASE)
+ingredients_section_pattern = re.compile(r'## Ingredients\s*(.*?)\n(##|\Z)', re.DOTALL)
+bullet_pattern = re.compile(r'-\s*(.+)')
+
+def extract_ingredients(content):
+    ingredients = []
+
+    # First try to find a 'portions' line
+    portions = None
+    portions_match = portions_pattern.search(content)
+    if portions_match:
+        portions = int(portions_match.group(1))
+
+    # If ingredients not in YAML, fallback to Markdown section
+    # (We assume ingredients are listed under "## Ingredients")
+    ingredients_match = ingredients_section_pattern.search(content)
+    if ingredients_match:
+        ingredients_text = ingredients_match.group(1)
+        ingredients = bullet_pattern.findall(ingredients_text)
+
+    return ingredients, portions
+
+# A parsed ingredient line: quantity in the canonical unit (None if the line has
+# no number), the canonical unit ('g', 'ml' or None for pieces) and the item name
+Ingredient = namedtuple('Ingredient', ['quantity', 'unit', 'item'])
+
+unicode_fractions = {
+    '½': 1 / 2, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 1 / 4, '¾': 3 / 4,
+    '⅕': 1 / 5, '⅖': 2 / 5, '⅗': 3 / 5, '⅘': 4 / 5, '⅙': 1 / 6, '⅚': 5 / 6,
+    '⅛': 1 / 8, '⅜': 3 / 8, '⅝': 5 / 8, '⅞': 7 / 8,
+}
+
+# Every unit with its canonical unit and the factor to get there
+unit_factors = {
+    'mg': ('g', 0.001), 'g': ('g', 1), 'gr': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kilo': ('g', 1000), 'kilogram': ('g', 1000),
+    'ml': ('ml', 1), 'cl': ('ml', 10), 'dl': ('ml', 100), 'l': ('ml', 1000),
+    'liter': ('ml', 1000), 'litre': ('ml', 1000), 'liters': ('ml', 1000), 'litres': ('ml', 1000),
+    'tsp': ('ml', 5), 'tl': ('ml', 5), 'theelepel': ('ml', 5), 'theelepels': ('ml', 5),
+    'tbsp': ('ml', 15), 'el': ('ml', 15), 'eetlepel': ('ml', 15), 'eetlepels': ('ml', 15),
+    'cup': ('ml', 240), 'cups': ('ml', 240),
+    'stuk': (None, 1), 'stuks': (None, 1), 'piece': (None, 1), 'pieces': (None, 1), 'pcs': (None, 1),
+}
+
+fraction_chars = ''.join(unicode_fractions)
+number_regex = rf'(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?\s?[{fraction_chars}]?|[{fraction_chars}])'
+unit_regex = '|'.join(sorted(unit_factors, key=len, reverse=True))
+
+# One compiled grammar for every line: quantity or range, optional unit, item
+ingredient_pattern = re.compile(
+    rf'^\s*(?P<quantity>{number_regex})'
+    rf'(?:\s*(?:-|–|to|tot)\s*(?P<upper>{number_regex}))?'
+    rf'\s*(?:(?P<unit>{unit_regex})\.?(?=\s|$))?'
+    rf'\s*(?:of\s+)?(?P<item>.*)$',
+    re.IGNORECASE)
+
+def parse_number(text):
+    # '1 1/2', '1½', '1/3', '0,5' and '2' all become floats
+    total = 0.0
+    for part in text.replace(',', '.').split():
+        if part[-1] in unicode_fractions:
+            total += unicode_fractions[part[-1]]
+            part = part[:-1]
+        if not part:
+            continue
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += float(numerator) / float(denominator)
+        else:
+            total += float(part)
+    return total
+
+def normalize_item(text):
+    # 'Feta (crumbled), to taste' and 'feta' are the same thing on a shopping list
+    text = re.sub(r'\(.*?\)', '', text).split(',')[0]
+    return ' '.join(text.lower().split()).strip(' .-')
+
+def parse_ingredient(line):
+    match = ingredient_pattern.match(line)
+    if not match or not match.group('item').strip():
+        # No numeric quantity
+        return Ingredient(None, None, normalize_item(line))
+
+    # For a range like '2-3' buy the upper amount
+    quantity = parse_number(match.group('upper') or match.group('quantity'))
+    unit = None
+    if match.group('unit'):
+        unit, factor = unit_factors[match.group('unit').lower()]
+        quantity *= factor
+    return Ingredient(quantity, unit, normalize_item(match.group('item')))
+
+def format_quantity(quantity, unit):
+    # Back from canonical units to something readable
+    if unit == 'g' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'kg'
+    elif unit == 'ml' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'l'
+    text = f"{quantity:.2f}".rstrip('0').rstrip('.')
+    return f"{text} {unit}" if unit else text
+
+def build_shopping_list(planned_recipes, pantry=None):
+    # planned_recipes: (parsed ingredients, portion factor) per planned meal.
+    # Totals are keyed on the normalized item and canonical unit, so '200 g feta'
+    # and '0.2 kg feta' end up on one line. What the pantry has is left off.
+    pantry = pantry or {}
+    ingredient_totals = {}
+    for ingredients, factor in planned_recipes:
+        for quantity, unit, item in ingredients:
+            key = (item, unit)
+            if quantity is None:
+                ingredient_totals.setdefault(key, None)
+            else:
+                ingredient_totals[key] = (ingredient_totals.get(key) or 0) + quantity * factor
+
+    final_shopping_list = []
+    for (item, unit), total in ingredient_totals.items():
+        have = pantry.get((item, unit), 0)
+        if have and (total is None or total <= have):
+            continue
+        if total is None:
+            # No numeric quantity
+            final_shopping_list.append(item)
+        else:
+            final_shopping_list.append(f"{format_quantity(total - have, unit)} {item}")
+
+    # Sort the list
+    final_shopping_list.sort()
+    return final_shopping_list
+
+pantry_line_pattern = re.compile(r'^\s*[-*]\s+(.+)$', re.MULTILINE)
+
+def load_pantry(path=None):
+    # {(item, unit): quantity} from the pantry note. A line without a quantity,
+    # like '- olive oil', means there is always enough of it.
+    path = path or pantry_path
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except OSError:
+        return {}
+    pantry = {}
+    for line in pantry_line_pattern.findall(content):
+        quantity, unit, item = parse_ingredient(line)
+        if quantity is None:
+            pantry[(item, unit)] = float('inf')
+        else:
+            pantry[(item, unit)] = pantry.get((item, unit), 0) + quantity
+    return pantry
+
+def line_cost(key, needed, pantry):
+    # Cost of one shopping list line: 1 for having to buy it at all, plus the
+    # unused part of the last package as a fraction of a package
+    have = pantry.get(key, 0)
+    if needed is None:
+        return 0.0 if have else 1.0
+    to_buy = needed - have
+    if to_buy <= 0:
+        return 0.0
+    item, unit = key
+    size = package_sizes.get(item) or default_package_sizes.get(unit)
+    if not size:
+        return 1.0
+    return 1.0 + leftover_weight * (-to_buy % size) / size
+
+def combine_quantity(old, quantity):
+    # Same rules as build_shopping_list: a line without a number never erases one
+    if quantity is None:
+        return old
+    return (old or 0) + quantity
+
+def recipe_contribution(recipe, portions):
+    # [(key, quantity)] of a recipe cooked for portions, one entry per key
+    default_portions = recipe.get('portions', 1)
+    factor = portions / default_portions if default_portions else 1
+    totals = {}
+    for quantity, unit, item in recipe['parsed']:
+        key = (item, unit)
+        totals[key] = combine_quantity(totals.get(key), None if quantity is None else quantity * factor)
+    return list(totals.items())
+
+def added_cost(totals, contribution, pantry):
+    delta = 0.0
+    for key, quantity in contribution:
+        if key in totals:
+            old = totals[key]
+            delta += line_cost(key, combine_quantity(old, quantity), pantry) - line_cost(key, old, pantry)
+        else:
+            delta += line_cost(key, quantity, pantry)
+    return delta
+
+def optimize_plan(slots, candidates, pantry=None, beam_width=10, allow_repeats=False, num_plans=3):
+    # Beam search for plans with few distinct items to buy and little left over.
+    # slots: [(day, meal, portions)], candidates: {meal: {title: recipe}}.
+    # Slots are filled one at a time; every partial plan is extended with every
+    # candidate, partial plans with the same set of meals are merged (their
+    # shopping lists are equal) and only the beam_width cheapest are kept.
+    # Returns up to num_plans (cost, [PlannedMeal]) tuples, cheapest first.
+    pantry = pantry or {}
+    contributions = {}
+    beam = [(0.0, [], {})]
+    for day, meal, portions in slots:
+        best = {}
+        for state_idx, (cost, meals, totals) in enumerate(beam):
+            used = {planned.title for planned in meals}
+            for title, recipe in candidates.get(meal, {}).items():
+                if not allow_repeats and title in used:
+                    continue
+                if (title, portions) not in contributions:
+                    contributions[(title, portions)] = recipe_contribution(recipe, portions)
+                new_cost = cost + added_cost(totals, contributions[(title, portions)], pantry)
+                signature = tuple(sorted([(m.meal, m.title, m.portions) for m in meals] + [(meal, title, portions)]))
+                if signature not in best or new_cost < best[signature][0]:
+                    best[signature] = (new_cost, state_idx, title)
+
+        if not best:
+            raise ValueError(f"Not enough recipes for {meal} on {day_label(day)}")
+
+        # Only the survivors get their own copy of the totals
+        new_beam = []
+        for new_cost, state_idx, title in heapq.nsmallest(beam_width, best.values(), key=lambda x: (x[0], x[2])):
+            _, meals, totals = beam[state_idx]
+            totals = dict(totals)
+            for key, quantity in contributions[(title, portions)]:
+                totals[key] = combine_quantity(totals.get(key), quantity)
+            new_beam.append((new_cost, meals + [PlannedMeal(day, meal, title, portions)], totals))
+        beam = new_beam
+
+    return [(cost, meals) for cost, meals, _ in beam[:num_plans]]
+
+def meal_plan_note(plan, shopping_list):
+    # (file name, title, [(heading, body)]) of the meal plan note
+    days = sorted({meal.day for meal in plan})
+    week_number = days[0].isocalendar()[1]
+    date_range = f"{days[0].strftime('%B %d')} - {days[-1].strftime('%B %d')}"
+    meals_content = f"### Date Range: {date_range}\n\n"
+    for day in days:
+        meals_content += f"### {day_label(day)}\n"
+        for meal in plan:
+            if meal.day == day:
+                meals_content += f"- {meal.meal}: [[{meal.title}]] ({meal.portions} portions)\n"
+        meals_content += "\n"
+
+    shopping_content = ''.join(f"- {item}\n" for item in shopping_list)
+
+    title = f"# Weekly Meal Plan for Week {week_number}"
+    return f"Meal Plan Week {week_number}.md", title, [("## Meals", meals_content), ("## Shopping List", shopping_content)]
+
+def format_meal_plan(plan, shopping_list):
+    # (file name, Markdown) of a new meal plan note
+    meal_plan_filename, title, sections = meal_plan_note(plan, shopping_list)
+    meal_plan_content = f"{title}\n"
+    for heading, body in sections:
+        meal_plan_content = ObsidianVault.replace_section(meal_plan_content, heading, body)
+    return meal_plan_filename, meal_plan_content
+
+def save_to_obsidian(plan, shopping_list, folder=None, vault=None):
+    # Returns the path of the note. Only the Meals and Shopping List sections are
+    # replaced, anything else added to an existing note stays. With a VaultWriter
+    # the note is written when that is flushed, so many weeks are saved together.
+    meal_plan_filename, title, sections = meal_plan_note(plan, shopping_list)
+    writer = vault or ObsidianVault.VaultWriter(folder or recipes_folder)
+    for heading, body in sections:
+        writer.set_section(meal_plan_filename, heading, body, title=title)
+    if vault is None:
+        writer.flush()
+    return writer.path(meal_plan_filename)
+
+def load_candidates(folder=None, path=None, slots=None):
+    # {meal: {title: recipe}} for every meal slot, from the recipe index
+    files = refresh_recipe_index(folder, path)
+    tag_index = build_tag_index(files)
+    return {meal: find_recipes(files, tag_index, tags) for meal, tags in (slots or meal_slots).items()}
+
+def assign_recipes(days, candidates, titles, portions=1):
+    # Plans the given titles in slot order (day by day, meal by meal), starting
+    # over at the first title when they run out
+    plan = []
+    for idx, (day, meal) in enumerate((day, meal) for day in days for meal in candidates):
+        title = titles[idx % len(titles)]
+        if title not in candidates[meal]:
+            raise ValueError(f"'{title}' is not a {meal} recipe")
+        plan.append(PlannedMeal(day, meal, title, portions))
+    return plan
+
+def generate_plans(candidates, start=None, weeks=1, num_days=5, workdays_only=True, titles=None, portions=1, pantry=None):
+    # [(plan, shopping list)] for weeks consecutive weeks. Without titles every
+    # week is optimized, leaving out last week's recipes when there are enough
+    # others so the weeks don't all look the same.
+    recipes = candidates_by_title(candidates)
+    first_days = plan_days(start, num_days, workdays_only)
+    results = []
+    previous = set()
+    for week in range(weeks):
+        days = [day + timedelta(weeks=week) for day in first_days]
+        if titles:
+            plan = assign_recipes(days, candidates, titles, portions)
+        else:
+            slots = [(day, meal, portions) for day in days for meal in candidates]
+            fresh = {meal: {title: recipe for title, recipe in options.items() if title not in previous}
+                     for meal, options in candidates.items()}
+            with Instrumentation.span('optimize_plan'):
+                try:
+                    plan = optimize_plan(slots, fresh, pantry, num_plans=1)[0][1]
+                except ValueError:
+                    plan = optimize_plan(slots, candidates, pantry, num_plans=1)[0][1]
+            previous = {meal.title for meal in plan}
+        with Instrumentation.span('shopping_list'):
+            results.append((plan, plan_shopping_list(plan, recipes, pantry)))
+    Instrumentation.count('plans', len(results))
+    return results
+
+class ToolTip:
+    def __init__(self, widget, text=''):
+        self.widget = widget
+        self.text = text
+        self.tipwindow = None
+        widget.bind('<Enter>', self.enter)
+        widget.bind('<Leave>', self.leave)
+
+    def enter(self, event=None):
+        self.showtip()
+
+    def leave(self, event=None):
+        self.hidetip()
+
+    def showtip(self):
+        if not self.text:
+            return
+
+        x = self.widget.winfo_rootx() + 20
+        y = self.widget.winfo_rooty() + self.widget.winfo_height() + 5
+
+        self.tipwindow = tw = tk.Toplevel(self.widget)
+        tw.wm_overrideredirect(1)  # Remove window decorations
+        tw.configure(bg="#ffffe0", padx=5, pady=5, relief="solid", borderwidth=1)
+        label = tk.Label(tw, text=self.text, bg="#ffffe0", wraplength=300)
+        label.pack()
+
+        tw.wm_geometry(f"+{x}+{y}")
+
+    def hidetip(self):
+        if self.tipwindow:
+            self.tipwindow.destroy()
+        self.tipwindow = None
+
+    def update_text(self, new_text):
+        self.text = new_text
+
+class MealPlannerApp:
+    def __init__(self, master):
+        self.master = master
+        master.title("Obsidian Meal Planner")
+
+        master.minsize(600, 400)
+        master.configure(bg="#d4f1c5", padx=30, pady=20)
+
+        self.style = ttk.Style()
+        self.style.theme_use("clam")
+
+        # Define custom styles
+        self.style.configure("Green.TFrame", background="#d4f1c5")
+        self.style.configure("Header.TFrame", background="#a5d6a7")
+        self.style.configure("Header.TLabel", background="#a5d6a7", foreground="#1b5e20", font=("Helvetica", 18, "bold"))
+        self.style.configure("Subtitle.TLabel", background="#a5d6a7", foreground="#2e7d32", font=("Helvetica", 10))
+        self.style.configure("Title.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 14))
+        self.style.configure("Bold.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 12, "bold"))
+        self.style.configure("Regular.TLabel", background="#d4f1c5", foreground="#1b5e20", font=("Helvetica", 12))
+        self.style.configure("Green.TButton", background="#4caf50", foreground="white", font=("Helvetica", 10))
+        self.style.map("Green.TButton",
+                       background=[("active", "#43a047")],
+                       foreground=[("active", "white")])
+        self.style.configure("TCombobox", fieldbackground="#ffffff")
+
+        # Recipes are loaded in the background and fill in as they arrive
+        self.files = {}
+        self.tag_index = {}
+        self.slot_recipes = {meal: {} for meal in meal_slots}
+        self.recipe_queue = queue.Queue()
+        self.pantry = load_pantry()
+
+        # Meal plan, one combobox and portion spinbox per (day, meal)
+        self.meal_plan = []
+        self.selected_recipes = {}
+        self.slot_portions = {}
+        self.tooltips = {}
+        self.comboboxes = {}
+        self.days = plan_days()
+
+        # Create widgets
+        self.create_widgets()
+
+        # Load recipes
+        self.start_loading_recipes()
+
+    def start_loading_recipes(self):
+        # The vault is scanned on a worker thread that only talks to the queue,
+        # Tk widgets are updated from poll_recipes on the main thread
+        def on_entry(file_path, entry):
+            tags = set(entry['tags'])
+            if any(tags.issuperset(as_tag_list(slot_tags)) for slot_tags in meal_slots.values()):
+                self.recipe_queue.put(('recipe', file_path, entry))
+
+        def on_progress(done, total):
+            self.recipe_queue.put(('progress', done, total))
+
+        def load():
+            try:
+                refresh_recipe_index(on_entry=on_entry, on_progress=on_progress)
+            except Exception as e:
+                self.recipe_queue.put(('error', str(e), None))
+            self.recipe_queue.put(('done', None, None))
+
+        threading.Thread(target=load, daemon=True).start()
+        self.master.after(50, self.poll_recipes)
+
+    def poll_recipes(self):
+        new_recipes = False
+        finished = False
+        while True:
+            try:
+                kind, first, second = self.recipe_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'recipe':
+                self.files[first] = second
+                add_to_tag_index(self.tag_index, first, second)
+                new_recipes = True
+            elif kind == 'progress':
+                self.progress_bar.configure(maximum=max(second, 1), value=first)
+                self.status_var.set(f"Loading recipes... {first}/{second} notes")
+            elif kind == 'error':
+                messagebox.showerror("Error", f"Could not load recipes: {first}")
+            elif kind == 'done':
+                finished = True
+
+        if new_recipes:
+            self.update_recipe_choices()
+
+        if finished:
+            self.progress_bar.grid_remove()
+            self.status_var.set(f"{len(self.files)} recipes loaded")
+        else:
+            self.master.after(50, self.poll_recipes)
+
+    def update_recipe_choices(self):
+        # {title: path} per meal slot, straight from the tag index
+        for meal, tags in meal_slots.items():
+            self.slot_recipes[meal] = {self.files[file_path]['title']: file_path
+                                       for file_path in matching_paths(self.tag_index, tags)}
+        for (day, meal), option_menu in self.comboboxes.items():
+            titles = sorted(self.slot_recipes[meal])
+            option_menu.configure(values=titles)
+            if not self.selected_recipes[(day, meal)].get() and titles:
+                self.selected_recipes[(day, meal)].set(titles[0])
+
+    def create_widgets(self):
+        # Header Frame
+        header_frame = ttk.Frame(self.master, style="Header.TFrame", padding=(0, 0, 0, 20))
+        header_frame.pack(fill='x')
+
+        title_label = ttk.Label(header_frame, text="Obsidian Meal Planner", style="Header.TLabel")
+        title_label.pack()
+        subtitle_label = ttk.Label(header_frame, text="Generate weekly meal plans and shopping lists", style="Subtitle.TLabel")
+        subtitle_label.pack()
+
+        # Instructions
+        instructions_label = ttk.Label(self.master, text="Select recipes and portions for each day and meal:", style="Title.TLabel")
+        instructions_label.pack(pady=10)
+
+        # Separator
+        separator = ttk.Separator(self.master, orient='horizontal')
+        separator.pack(fill='x', pady=10)
+
+        # Main selection frame (using grid)
+        selection_frame = ttk.Frame(self.master, style="Green.TFrame")
+        selection_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Add column headers, a recipe and a portions column per meal slot
+        ttk.Label(selection_frame, text="Day", style="Bold.TLabel").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        for slot_idx, meal in enumerate(meal_slots):
+            column = 1 + 2 * slot_idx
+            ttk.Label(selection_frame, text=meal, style="Bold.TLabel").grid(row=0, column=column, padx=5, pady=5, sticky='w')
+            ttk.Label(selection_frame, text="Portions", style="Bold.TLabel").grid(row=0, column=column + 1, padx=5, pady=5, sticky='w')
+
+        for idx, day in enumerate(self.days, start=1):
+            ttk.Label(selection_frame, text=day_label(day), style="Regular.TLabel").grid(row=idx, column=0, padx=5, pady=5, sticky='e')
+            for slot_idx, meal in enumerate(meal_slots):
+                column = 1 + 2 * slot_idx
+                key = (day, meal)
+                var = tk.StringVar(value='')
+                self.selected_recipes[key] = var
+                option_menu = ttk.Combobox(selection_frame, textvariable=var, values=[], state="readonly", width=40)
+                option_menu.grid(row=idx, column=column, padx=5, pady=5, sticky='w')
+                self.comboboxes[key] = option_menu
+
+                # Create a tooltip for the combobox
+                tooltip = ToolTip(option_menu, text=var.get())
+                self.tooltips[key] = tooltip
+                var.trace_add("write", lambda *args, v=var, t=tooltip: t.update_text(v.get()))
+
+                # Portion spinbox with default = 1
+                portion_var = tk.IntVar(value=1)
+                self.slot_portions[key] = portion_var
+                portions_spin = ttk.Spinbox(selection_frame, from_=1, to=100, textvariable=portion_var, width=5)
+                portions_spin.grid(row=idx, column=column + 1, padx=5, pady=5, sticky='w')
+
+        # Button frame at the bottom, aligned to the right
+        button_frame = ttk.Frame(self.master, style="Green.TFrame")
+        button_frame.pack(fill='x', pady=20)
+
+        button_frame.columnconfigure(0, weight=1)
+
+        # Loading progress, on the left of the buttons
+        self.status_var = tk.StringVar(value="Loading recipes...")
+        status_label = ttk.Label(button_frame, textvariable=self.status_var, style="Regular.TLabel")
+        status_label.grid(row=0, column=0, padx=5, sticky='w')
+        self.progress_bar = ttk.Progressbar(button_frame, mode='determinate', length=150)
+        self.progress_bar.grid(row=1, column=0, padx=5, sticky='w')
+
+        self.suggest_button = ttk.Button(button_frame, text="Suggest Plan", style="Green.TButton", command=self.suggest_meal_plan)
+        self.suggest_button.grid(row=0, column=1, padx=10, sticky='e')
+
+        self.generate_button = ttk.Button(button_frame, text="Generate Meal Plan", style="Green.TButton", command=self.generate_meal_plan)
+        self.generate_button.grid(row=0, column=2, padx=10, sticky='e')
+
+        self.exit_button = ttk.Button(button_frame, text="Exit", style="Green.TButton", command=self.master.quit)
+        self.exit_button.grid(row=0, column=3, padx=(10, 20), sticky='e')
+
+    def suggest_meal_plan(self):
+        # Fill every slot with the cheapest plan the optimizer finds, keeping the
+        # portions that are set
+        candidates = {meal: {title: recipe_from_entry(file_path, self.files[file_path])
+                             for title, file_path in recipes.items()}
+                      for meal, recipes in self.slot_recipes.items()}
+        slots = [(day, meal, self.slot_portions[(day, meal)].get()) for day in self.days for meal in meal_slots]
+        try:
+            with Instrumentation.span('optimize_plan'):
+                plans = optimize_plan(slots, candidates, self.pantry, num_plans=1)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+
+        cost, plan = plans[0]
+        for meal in plan:
+            self.selected_recipes[(meal.day, meal.meal)].set(meal.title)
+        self.status_var.set(f"Suggested plan, {len(plan_shopping_list(plan, candidates_by_title(candidates), self.pantry))} items to buy")
+
+    def generate_meal_plan(self):
+        # Build the meal plan from every filled in slot
+        self.meal_plan = []
+        selected_recipes_info = {}
+        for (day, meal), var in self.selected_recipes.items():
+            recipe_title = var.get()
+            if recipe_title:
+                self.meal_plan.append(PlannedMeal(day, meal, recipe_title, self.slot_portions[(day, meal)].get()))
+                file_path = self.slot_recipes[meal][recipe_title]
+                selected_recipes_info[recipe_title] = recipe_from_entry(file_path, self.files[file_path])
+
+        if not self.meal_plan:
+            messagebox.showwarning("Warning", "Select at least one recipe first.")
+            return
+
+        with Instrumentation.span('shopping_list'):
+            final_shopping_list = plan_shopping_list(self.meal_plan, selected_recipes_info, self.pantry)
+
+        # Confirm and save
+        confirm = messagebox.askyesno("Confirm", "Do you want to save the meal plan and shopping list to Obsidian?")
+        if confirm:
+            try:
+                with Instrumentation.span('save_plan'):
+                    meal_plan_path = save_to_obsidian(self.meal_plan, final_shopping_list)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save the meal plan: {e}")
+                return
+            messagebox.showinfo("Success", f"Meal plan saved to {meal_plan_path}")
+
+
+def run_gui():
+    if tk is None:
+        sys.exit("tkinter is not available, use the plan command instead.")
+    root = tk.Tk()
+    app = MealPlannerApp(root)
+    root.mainloop()
+
+def run_plan(args):
+    global meal_slots
+    if args.slot:
+        meal_slots = {}
+        for slot in args.slot:
+            meal, _, tags = slot.partition('=')
+            meal_slots[meal] = tags.split('+') if tags else meal
+    folder = args.vault or recipes_folder
+    start = datetime.strptime(args.start, '%Y-%m-%d').date() if args.start else None
+    titles = [title.strip() for title in args.recipes.split(',') if title.strip()] if args.recipes else None
+
+    with Instrumentation.span('load_candidates'):
+        candidates = load_candidates(folder, args.index)
+    for meal, recipes in candidates.items():
+        print(f"{len(recipes)} recipes for {meal}")
+    pantry = {} if args.no_pantry else load_pantry(args.pantry or os.path.join(folder, "Pantry.md"))
+
+    try:
+        results = generate_plans(candidates, start, args.weeks, args.days, not args.all_days, titles, args.portions, pantry)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    if args.dry_run:
+        for plan, shopping_list in results:
+            print(format_meal_plan(plan, shopping_list)[1])
+        return
+
+    # Every week is one note, all written together at the end
+    with Instrumentation.span('save_plan'), ObsidianVault.VaultWriter(args.output_dir or folder) as vault:
+        for plan, shopping_list in results:
+            print(f"Meal plan for {save_to_obsidian(plan, shopping_list, vault=vault)}")
+    print(f"{len(vault.written)} meal plan notes written")
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan meals from the recipes in the Obsidian vault.")
+    subparsers = parser.add_subparsers(dest='command')
+    gui_parser = subparsers.add_parser('gui', help="Open the planner window (the default)")
+    plan_parser = subparsers.add_parser('plan', help="Write meal plans without the GUI")
+    plan_parser.add_argument('--days', type=int, default=5, help="Days per plan")
+    plan_parser.add_argument('--all-days', action='store_true', help="Plan the weekend too")
+    plan_parser.add_argument('--start', default=None, help="First day, YYYY-MM-DD (default: Monday of this week)")
+    plan_parser.add_argument('--weeks', type=int, default=1, help="Number of consecutive weekly plans to write")
+    plan_parser.add_argument('--recipes', default=None, help="Comma separated recipe titles in slot order (default: optimize)")
+    plan_parser.add_argument('--portions', type=int, default=1, help="Portions per meal")
+    plan_parser.add_argument('--slot', action='append', default=None,
+                             help="Meal slot as Meal=Tag or Meal=Tag1+Tag2, repeat for more slots (default: Lunch=LunchSalad)")
+    plan_parser.add_argument('--vault', default=None, help="Recipes folder (default: the one in the script)")
+    plan_parser.add_argument('--index', default=None, help="Recipe index file (default: ~/.meal_planner_index.json)")
+    plan_parser.add_argument('--pantry', default=None, help="Pantry note (default: Pantry.md in the recipes folder)")
+    plan_parser.add_argument('--no-pantry', action='store_true', help="Ignore the pantry")
+    plan_parser.add_argument('--output-dir', default=None, help="Folder for the meal plan notes (default: the recipes folder)")
+    plan_parser.add_argument('--dry-run', action='store_true', help="Print the plans instead of writing them")
+    for command_parser in (gui_parser, plan_parser):
+        command_parser.add_argument('--metrics', default=None, help="Append the run's stage timings and counters to this JSON lines file, or write a Prometheus textfile when it ends in .prom")
+    args = parser.parse_args()
+    Instrumentation.configure('meal_planner')
+
+    if args.command == 'plan':
+        run_plan(args)
+    else:
+        run_gui()
+
+    if getattr(args, 'metrics', None):
+        Instrumentation.export(args.metrics)
+
+if __name__ == '__main__':
     main()
\ No newline at end of file